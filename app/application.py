@@ -6,11 +6,18 @@ from flask import jsonify
 from flask_restful import Api
 
 from app import settings
+from app.common.metrics import metrics
+from app.common.query_stats import query_stats
 from app.exception.exceptions import MessageSaveException
 from app.repository import database
-from app.resources.health import Health, DatabaseHealth, HealthDetails
-from app.resources.messages import MessageList, MessageSend, MessageById, ModifyById
+from app.repository.counters import LabelCounter
+from app.repository.pool import POOL_CLASSES
+from app.repository.search import SearchIndex
+from app.resources.health import Health, DatabaseHealth, HealthDetails, Metrics
+from app.resources.messages import MessageList, MessageCount, MessageExport, MessageSearch, MessageSend, \
+    MessageBulkSend, MessageById, ModifyById, ModifyBatch
 from app.resources.drafts import Drafts
+from app.resources.threads import ThreadById, ThreadList
 from werkzeug.exceptions import BadRequest
 
 # initialise logging defaults for project
@@ -39,10 +46,19 @@ werkzeug_logger.setLevel(level=settings.SMS_WERKZEUG_LOG_LEVEL)
 app = Flask(__name__)
 api = Api(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = settings.SECURE_MESSAGING_DATABASE_URL
+if settings.SQLALCHEMY_POOL_CLASS not in POOL_CLASSES:
+    raise ValueError("SQLALCHEMY_POOL_CLASS must be one of {0}".format(', '.join(POOL_CLASSES)))
+app.config['SQLALCHEMY_POOL_CLASS'] = settings.SQLALCHEMY_POOL_CLASS
 app.config['SQLALCHEMY_POOL_SIZE'] = settings.SQLALCHEMY_POOL_SIZE
+app.config['SQLALCHEMY_MAX_OVERFLOW'] = settings.SQLALCHEMY_MAX_OVERFLOW
+app.config['SQLALCHEMY_POOL_TIMEOUT'] = settings.SQLALCHEMY_POOL_TIMEOUT
+app.config['SQLALCHEMY_POOL_RECYCLE'] = settings.SQLALCHEMY_POOL_RECYCLE
+app.config['SQLALCHEMY_POOL_PRE_PING'] = settings.SQLALCHEMY_POOL_PRE_PING
 app.logger.addHandler(logging.StreamHandler())
 app.logger.setLevel(settings.APP_LOG_LEVEL)
 database.db.init_app(app)
+query_stats.init_app(app)
+metrics.init_app(app)
 
 logger = logging.getLogger(__name__)
 logger.info('Starting application')
@@ -53,21 +69,32 @@ def drop_database():
 
 with app.app_context():
     database.db.create_all()
-    database.db.session.commit()
+    database.create_missing_indexes(database.db.engine)
+    LabelCounter.rebuild_if_missing(database.db.session)
+    SearchIndex.rebuild_if_missing(database.db.session)
 
 api.add_resource(Health, '/health')
 api.add_resource(DatabaseHealth, '/health/db')
 api.add_resource(HealthDetails, '/health/details')
+api.add_resource(Metrics, '/metrics')
 api.add_resource(MessageList, '/messages')
+api.add_resource(MessageCount, '/messages/count')
+api.add_resource(MessageExport, '/messages/export')
+api.add_resource(MessageSearch, '/messages/search')
 api.add_resource(MessageSend, '/message/send')
+api.add_resource(MessageBulkSend, '/message/send/bulk')
 api.add_resource(MessageById, '/message/<message_id>')
 api.add_resource(ModifyById, '/message/<message_id>/modify')
+api.add_resource(ModifyBatch, '/messages/modify')
 api.add_resource(Drafts, '/draft/save')
+api.add_resource(ThreadList, '/threads')
+api.add_resource(ThreadById, '/thread/<thread_id>')
 
 
 @app.before_request
 def before_request():
-    if request.endpoint is not None and 'health' not in request.endpoint and 'user_urn' not in request.headers:
+    if request.endpoint is not None and 'health' not in request.endpoint and request.endpoint != 'metrics' \
+            and 'user_urn' not in request.headers:
             raise (BadRequest(description="User URN required to access this Microservice Resource"))
 
 
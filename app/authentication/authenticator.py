@@ -1,12 +1,45 @@
 from app.authentication.jwt import decode
-from app.authentication.jwe import Decrypter
+from app.authentication.jwe import decrypt_pool
+from app import settings
+from app.common.lru import LRUCache
 from flask import Response
 from jose import JWTError
+from werkzeug.exceptions import ServiceUnavailable
+import hashlib
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 
+class TokenCache(LRUCache):
+    """Bounded LRU of validated claims keyed by a digest of the encrypted token.
+    Entries expire after ttl seconds or at the token's exp claim, whichever is sooner"""
+
+    def __init__(self, max_size=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+    @staticmethod
+    def _digest(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).hexdigest()
+
+    def get(self, token):
+        """returns the cached claims for a token, None if absent or expired"""
+        return super().get(self._digest(token))
+
+    def put(self, token, claims):
+        """cache validated claims, evicting the least recently used entry when full"""
+        expires = time.time() + self.ttl
+        if 'exp' in claims:
+            expires = min(expires, float(claims['exp']))
+        super().put(self._digest(token), claims, expires)
+
+
+token_cache = TokenCache()
+
+
 def authenticate(request):
 
     if request.headers.get('authorization'):
@@ -24,9 +57,11 @@ def authenticate(request):
 
 
 def check_jwt(token):
+    if token_cache.get(token) is not None:
+        return {'status': "ok"}
+
     try:
-        decrypter = Decrypter()
-        decrypted_jwt_token = decrypter.decrypt_token(token)
+        decrypted_jwt_token = decrypt_pool.decrypt_token(token)
         decoded_jwt_token = decode(decrypted_jwt_token)
 
         request_authenticated = False
@@ -48,6 +83,7 @@ def check_jwt(token):
             return res
 
         if request_authenticated:
+            token_cache.put(token, decoded_jwt_token)
             # create user model
             logger.debug("""The message has the correct claims and it can be decrypted properly. JWT value is: {},
                             RU is: {}, survey is: {}, CC is: {}""".format(decoded_jwt_token,
@@ -61,3 +97,6 @@ def check_jwt(token):
         logger.debug(
             'The message does not have a JWT that I can decrypted. Is the JWT Algorithm and Secret setup correctly?')
         return res
+    except ServiceUnavailable:
+        res = Response(response="Token could not be checked, try again later", status=503, mimetype="text/html")
+        return res
@@ -1,7 +1,12 @@
 """
 Module to generate encrypt and decrypt token
 """
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from cryptography.hazmat.backends.openssl.backend import backend
 from cryptography.hazmat.primitives.ciphers import Cipher
 from cryptography.hazmat.primitives.ciphers import algorithms
@@ -9,13 +14,47 @@ from cryptography.hazmat.primitives.ciphers import modes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import hashes
 from app import settings
+from app.common.metrics import metrics
 import base64
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
 from flask import json
 
+logger = logging.getLogger(__name__)
+
 IV_EXPECTED_LENGTH = 12
 CEK_EXPECT_LENGTH = 32
 
+_loaded_keys = {}
+_loaded_keys_lock = threading.Lock()
+
+
+def load_keys(private_key, private_key_password, public_key):
+    """ returns (private key, public key) objects for the PEMs, each distinct set is parsed once per process"""
+    pem = (private_key, private_key_password, public_key)
+    keys = _loaded_keys.get(pem)
+    if keys is None:
+        with _loaded_keys_lock:
+            keys = _loaded_keys.get(pem)
+            if keys is None:
+                keys = (backend.load_pem_private_key(private_key.encode(), private_key_password.encode()),
+                        backend.load_pem_public_key(public_key.encode()))
+                _loaded_keys[pem] = keys
+    return keys
+
+
+def reload_keys():
+    """ read the key PEMs from their files again and discard loaded keys, used after key rotation.
+    The decrypt pool is shut down so its next workers start with the new keys"""
+    with open(settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PATH) as private_key_file:
+        private_key = private_key_file.read()
+    with open(settings.SM_USER_AUTHENTICATION_PUBLIC_KEY_PATH) as public_key_file:
+        public_key = public_key_file.read()
+    with _loaded_keys_lock:
+        settings.SM_USER_AUTHENTICATION_PRIVATE_KEY = private_key
+        settings.SM_USER_AUTHENTICATION_PUBLIC_KEY = public_key
+        _loaded_keys.clear()
+    decrypt_pool.shutdown()
+
 
 class Encrypter:
 
@@ -34,13 +73,7 @@ class Encrypter:
 
     def _load_keys(self, private_key, private_key_password, public_key):
         """ used to load keys"""
-        private_key_bytes = private_key.encode()  # to bytes
-        private_key_password_bytes = private_key_password.encode()
-        public_key_bytes = public_key.encode()
-
-        self.private_key = backend.load_pem_private_key(private_key_bytes, private_key_password_bytes)
-
-        self.public_key = backend.load_pem_public_key(public_key_bytes)
+        self.private_key, self.public_key = load_keys(private_key, private_key_password, public_key)
 
     def encrypt_token(self, token):
         """
@@ -86,13 +119,7 @@ class Decrypter:
 
     def _load_keys(self, private_key, private_key_password, public_key):
         """ used to load keys"""
-        private_key_bytes = private_key.encode()  # to bytes
-        private_key_password_bytes = private_key_password.encode()
-        public_key_bytes = public_key.encode()
-
-        self.private_key = backend.load_pem_private_key(private_key_bytes, private_key_password_bytes)
-
-        self.public_key = backend.load_pem_public_key(public_key_bytes)
+        self.private_key, self.public_key = load_keys(private_key, private_key_password, public_key)
 
     def decrypt_token(self, encrypted_token):
         """
@@ -159,3 +186,66 @@ class Decrypter:
             while len(text) % 4 != 0:
                 text += "="
         return base64.urlsafe_b64decode(text)
+
+
+def _decrypt_token(encrypted_token):
+    """ decrypt a token in a pool worker, each worker process keeps its own loaded keys"""
+    return Decrypter().decrypt_token(encrypted_token)
+
+
+class DecryptPool:
+    """ Decrypts tokens on worker processes so RSA work scales with cores instead of serialising on the GIL.
+    With no processes tokens are decrypted on the calling thread. The pool starts on first use, after any server fork"""
+
+    def __init__(self, processes=settings.TOKEN_DECRYPT_PROCESSES, timeout=settings.TOKEN_DECRYPT_TIMEOUT):
+        self.processes = processes
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def decrypt_token(self, encrypted_token):
+        """ decrypt a token, waiting on a worker process when the pool is enabled.
+        Raises ServiceUnavailable when a worker takes longer than the timeout or the pool has broken,
+        a broken pool is replaced so later tokens are decrypted on fresh workers"""
+        start = time.perf_counter()
+        try:
+            if self.processes <= 0:
+                return _decrypt_token(encrypted_token)
+            executor = self._get_executor()
+            future = None
+            try:
+                future = executor.submit(_decrypt_token, encrypted_token)
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                future.cancel()
+                logger.error("Token decryption timed out after {0} seconds".format(self.timeout))
+                raise ServiceUnavailable(description="Token decryption timed out")
+            except BrokenProcessPool as e:
+                logger.error("Token decryption pool is broken, replacing it: {0}".format(e))
+                self._discard_executor(executor)
+                raise ServiceUnavailable(description="Token decryption unavailable")
+        finally:
+            metrics.decrypt_seconds.observe(time.perf_counter() - start)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _discard_executor(self, executor):
+        """drop a broken executor so the next decryption starts a new one. It is not shut down, as a worker
+        that died holding the call queue lock makes shutdown block, and a broken pool already stops its workers"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self._executor
+
+
+decrypt_pool = DecryptPool()
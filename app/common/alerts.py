@@ -1,18 +1,25 @@
 from app import settings
 from notifications_python_client import NotificationsAPIClient
 
+import atexit
 import logging
+import queue
+import threading
+import time
 
 
 logger = logging.getLogger(__name__)
 
 
 class AlertViaGovNotify:
-    """Notify Api handler"""
+    """Notify Api handler, one client is shared by every send"""
+
+    _client = None
+    _client_lock = threading.Lock()
 
     @staticmethod
     def send(email,  reference):
-        notifications_client = NotificationsAPIClient(settings.NOTIFICATION_COMBINED_KEY)
+        notifications_client = AlertViaGovNotify._get_client()
         notifications_client.send_email_notification(
             email_address=email,
             template_id=settings.NOTIFICATION_TEMPLATE_ID,
@@ -20,6 +27,26 @@ class AlertViaGovNotify:
             reference=reference
         )
 
+    @staticmethod
+    def _get_client():
+        """returns the shared notifications client, creating it on first use"""
+        if AlertViaGovNotify._client is None:
+            with AlertViaGovNotify._client_lock:
+                if AlertViaGovNotify._client is None:
+                    AlertViaGovNotify._client = NotificationsAPIClient(settings.NOTIFICATION_COMBINED_KEY)
+        return AlertViaGovNotify._client
+
+
+class AlertViaLogging:
+    """Local stand-in for Notify which logs and records alerts instead of sending them"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, email, reference):
+        logger.info("Alert for {0} with reference {1}".format(email, reference))
+        self.sent.append((email, reference))
+
 
 class AlertUser:
     """Alert User"""
@@ -36,3 +63,101 @@ class AlertUser:
             logger.exception(e)
         finally:
             return 201, 'OK'
+
+
+class AlertDispatcher:
+    """Sends alerts from background worker threads so requests do not wait on the alert service.
+    Workers take queued alerts one at a time and retry each before counting it as failed, alerts still
+    queued at exit get up to shutdown_timeout seconds to be sent.
+    With no workers alerts are sent, with retries, on the calling thread"""
+
+    def __init__(self, alerter=None, workers=settings.NOTIFICATION_WORKERS,
+                 max_retries=settings.NOTIFICATION_MAX_RETRIES, retry_delay=settings.NOTIFICATION_RETRY_DELAY,
+                 shutdown_timeout=settings.NOTIFICATION_SHUTDOWN_TIMEOUT):
+        self._alerter = alerter
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.sent_count = 0
+        self.failed_count = 0
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def alert_method(self):
+        """the alerter given at construction, otherwise the current AlertUser default"""
+        return self._alerter if self._alerter is not None else AlertUser.alert_method
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def send(self, email, reference):
+        """queue an alert, returning the same status as AlertUser.send"""
+        if self.workers <= 0:
+            self._deliver(email, reference)
+        else:
+            self._start()
+            self._queue.put((email, reference))
+        return 201, 'OK'
+
+    def join(self):
+        """block until every queued alert has been sent or has failed"""
+        self._queue.join()
+
+    def drain(self, timeout=None):
+        """wait up to timeout seconds, by default shutdown_timeout, for queued alerts to be sent or fail.
+        Returns the number still unsent, which is logged as they are lost when the process exits"""
+        deadline = time.monotonic() + (self.shutdown_timeout if timeout is None else timeout)
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._queue.all_tasks_done.wait(remaining)
+            unsent = self._queue.unfinished_tasks
+        if unsent:
+            logger.error("{0} queued alerts were not sent before shutdown".format(unsent))
+        return unsent
+
+    def _start(self):
+        """start the worker threads on first use so none are created before the process forks,
+        registering a drain so queued alerts are given time to send at exit"""
+        if len(self._threads) < self.workers:
+            with self._lock:
+                if not self._threads:
+                    atexit.register(self.drain)
+                while len(self._threads) < self.workers:
+                    thread = threading.Thread(target=self._work, name='alert-dispatcher-{0}'.format(len(self._threads)))
+                    thread.daemon = True
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            email, reference = self._queue.get()
+            try:
+                self._deliver(email, reference)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, email, reference):
+        """send one alert, retrying with a growing delay, and record the outcome"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.alert_method.send(email, reference)
+                with self._lock:
+                    self.sent_count += 1
+                return
+            except Exception as e:
+                logger.warning("Alert {0} attempt {1} failed: {2}".format(reference, attempt + 1, e))
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_delay * (attempt + 1))
+        logger.error("Alert {0} failed after {1} attempts".format(reference, self.max_retries + 1))
+        with self._lock:
+            self.failed_count += 1
+
+
+alert_dispatcher = AlertDispatcher()
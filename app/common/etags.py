@@ -0,0 +1,18 @@
+import hashlib
+
+from flask import Response, request
+
+
+def mailbox_etag(version, user_urn, *parts):
+    """strong etag for a response built from the user's mailbox at version, parts distinguish the resource"""
+    key = '|'.join(str(part) for part in (version, user_urn) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def not_modified(etag):
+    """returns a 304 response when the request already holds etag, otherwise None"""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded least recently used map, safe to share between threads.
+    Entries can carry an expiry time, after which they are dropped and read as misses. A max_size of 0 caches
+    nothing. Lookups through get are counted as hits or misses for the cache metrics"""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """returns the value cached for key, None if absent or expired"""
+        value = self._lookup(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _lookup(self, key):
+        """get without counting, for caches that count their lookups themselves"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self._entries.move_to_end(key)
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            return None
+
+    def put(self, key, value, expires=None):
+        """cache value until expires, by default ttl seconds from now, evicting the least recently used entry
+        when full"""
+        if self.max_size <= 0:
+            return
+        if expires is None and self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
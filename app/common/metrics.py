@@ -0,0 +1,148 @@
+import bisect
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts observations into buckets, reported cumulatively as Prometheus histograms are"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, the last bound is +Inf"""
+        with self._lock:
+            counts = list(self._counts)
+        running = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class Metrics:
+    """In process counters for the /metrics endpoint. Requests are counted and timed per resource, token
+    decryption is timed and connection pool checkouts, new connections and invalidations are counted.
+    Recording is a dictionary update under a lock, the work of formatting is left to the scrape"""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.request_seconds = {}
+        self.decrypt_seconds = Histogram()
+        self.pool_events = Counter()
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(Pool, 'checkout', self._checkout)
+            event.listen(Pool, 'connect', self._connect)
+            event.listen(Pool, 'invalidate', self._invalidate)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def observe_request(self, resource, method, status, seconds):
+        with self._lock:
+            self.requests[(resource, method, status)] += 1
+            histogram = self.request_seconds.get((resource, method))
+            if histogram is None:
+                histogram = self.request_seconds[(resource, method)] = Histogram()
+        histogram.observe(seconds)
+
+    def snapshot(self):
+        """copies of the request counts and histograms and the pool event counts, safe to read while requests run"""
+        with self._lock:
+            return dict(self.requests), dict(self.request_seconds), dict(self.pool_events)
+
+    def _count_pool_event(self, name):
+        with self._lock:
+            self.pool_events[name] += 1
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self._count_pool_event('checkout')
+
+    def _connect(self, dbapi_connection, connection_record):
+        self._count_pool_event('connect')
+
+    def _invalidate(self, dbapi_connection, connection_record, exception):
+        self._count_pool_event('invalidate')
+
+    @staticmethod
+    def _start_request():
+        g.metrics_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            self.observe_request(request.endpoint or 'unmatched', request.method, response.status_code,
+                                 time.perf_counter() - start)
+        return response
+
+
+class Exposition:
+    """Builds the Prometheus text exposition format"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.lines = []
+
+    def counter(self, name, description, samples):
+        self._family(name, description, 'counter', samples)
+
+    def gauge(self, name, description, samples):
+        self._family(name, description, 'gauge', samples)
+
+    def histogram(self, name, description, histograms):
+        """histograms is a list of (labels, Histogram) pairs"""
+        self.lines.append('# HELP {0} {1}'.format(name, description))
+        self.lines.append('# TYPE {0} histogram'.format(name))
+        for labels, histogram in histograms:
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                self.lines.append(self._sample(name + '_bucket', dict(labels, le=le), count))
+            self.lines.append(self._sample(name + '_sum', labels, histogram.sum))
+            self.lines.append(self._sample(name + '_count', labels, histogram.count))
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+    def _family(self, name, description, kind, samples):
+        """samples is a list of (labels, value) pairs"""
+        self.lines.append('# HELP {0} {1}'.format(name, description))
+        self.lines.append('# TYPE {0} {1}'.format(name, kind))
+        for labels, value in samples:
+            self.lines.append(self._sample(name, labels, value))
+
+    @staticmethod
+    def _sample(name, labels, value):
+        if labels:
+            name += '{' + ','.join('{0}="{1}"'.format(key, str(labels[key]).replace('\\', '\\\\')
+                                                      .replace('"', '\\"')) for key in sorted(labels)) + '}'
+        return '{0} {1}'.format(name, value)
+
+
+metrics = Metrics()
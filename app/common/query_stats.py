@@ -0,0 +1,91 @@
+import logging
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import settings
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_STATEMENT_LENGTH = 200
+
+
+class QueryStats:
+    """Counts and times every SQL statement using engine events, including those run on a bare connection.
+    With headers on, each response carries the query count, total database time and slowest statement time
+    of its request and a log line records them with the slowest statement.
+    Statements taking at least slow_query_ms are logged, 0 turns this off"""
+
+    def __init__(self, headers=settings.SQL_INSTRUMENTATION, slow_query_ms=settings.SQL_SLOW_QUERY_MS):
+        self.headers = headers
+        self.slow_query_ms = slow_query_ms
+        self._listening = False
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @property
+    def enabled(self):
+        return bool(self.headers or self.slow_query_ms)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            logger.warning("Slow query took {0:.1f} ms: {1}".format(elapsed_ms, statement))
+        if has_request_context() and 'sql_stats' in g:
+            self.record(g.sql_stats, statement, elapsed_ms)
+
+    @staticmethod
+    def _handle_error(context):
+        """forget the start time of a statement that failed, as it never reaches after_cursor_execute"""
+        starts = context.connection.info.get('query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    @staticmethod
+    def record(stats, statement, elapsed_ms):
+        """add one statement to a request's stats"""
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        if elapsed_ms >= stats['slowest_ms']:
+            stats['slowest_ms'] = elapsed_ms
+            stats['slowest'] = statement
+
+    @staticmethod
+    def new_stats():
+        return {'count': 0, 'total_ms': 0.0, 'slowest_ms': 0.0, 'slowest': None}
+
+    def _start_request(self):
+        if self.headers:
+            g.sql_stats = QueryStats.new_stats()
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        response.headers['X-SQL-Query-Count'] = str(stats['count'])
+        response.headers['X-SQL-Time-Ms'] = '{0:.3f}'.format(stats['total_ms'])
+        response.headers['X-SQL-Slowest-Ms'] = '{0:.3f}'.format(stats['slowest_ms'])
+        slowest = (stats['slowest'] or '').replace('\n', ' ')[:SLOWEST_STATEMENT_LENGTH]
+        logger.info("{0} {1} status={2} queries={3} db_ms={4:.3f} slowest_ms={5:.3f} slowest={6}".format(
+            request.method, request.path, response.status_code, stats['count'], stats['total_ms'],
+            stats['slowest_ms'], slowest))
+        return response
+
+
+query_stats = QueryStats()
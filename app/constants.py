@@ -14,3 +14,7 @@ MAX_SURVEY_LEN = 60      # Maximum size of the message collection instrument ide
 
 MAX_STATUS_LABEL_LEN = 50          # Maximum length of a label column
 MAX_STATUS_ACTOR_LEN = 100         # Maximum length of the actor column
+
+# Request Size Limits
+
+MAX_MODIFY_BATCH_SIZE = 500        # Maximum number of msg_ids in one batch label change
@@ -0,0 +1,113 @@
+import logging
+from collections import Counter
+
+from sqlalchemy import and_, bindparam, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.repository.database import LabelCount, MailboxVersion, Status
+from app.validation.user import User
+
+logger = logging.getLogger(__name__)
+
+_label_count = LabelCount.__table__
+_mailbox_version = MailboxVersion.__table__
+_status = Status.__table__
+
+INCREMENT_COUNT = _label_count.update().where(and_(_label_count.c.actor == bindparam('b_actor'),
+                                                   _label_count.c.label == bindparam('b_label')))\
+    .values(count=_label_count.c.count + bindparam('b_delta'))
+INSERT_COUNT = _label_count.insert()
+INCREMENT_VERSION = _mailbox_version.update().where(_mailbox_version.c.actor == bindparam('b_actor'))\
+    .values(version=_mailbox_version.c.version + 1)
+INSERT_VERSION = _mailbox_version.insert()
+
+
+def _increment(executor, update, update_params, insert, row):
+    """run update, or insert row in a savepoint if none matched, re-running update if a concurrent insert won"""
+    if executor.execute(update, update_params).rowcount:
+        return
+    savepoint = executor.begin_nested()
+    try:
+        executor.execute(insert, row)
+        savepoint.commit()
+    except IntegrityError:
+        savepoint.rollback()
+        logger.info("Row inserted concurrently, retrying update {0}".format(update_params))
+        executor.execute(update, update_params)
+
+
+class LabelCounter:
+    """Keeps the label_count table in step with status rows"""
+
+    @staticmethod
+    def deltas(rows, delta=1):
+        """returns {(actor, label): change} for an iterable of (actor, label) status rows"""
+        changes = Counter()
+        for actor, label in rows:
+            changes[(actor, label)] += delta
+        return changes
+
+    @staticmethod
+    def adjust(executor, deltas):
+        """apply {(actor, label): change} to the counts through executor, a session or connection, without committing.
+        Keys are applied in sorted order so concurrent writers lock count rows in the same order"""
+        for (actor, label), delta in sorted(deltas.items()):
+            if delta == 0:
+                continue
+            _increment(executor, INCREMENT_COUNT, {'b_actor': actor, 'b_label': label, 'b_delta': delta},
+                       INSERT_COUNT, {'actor': actor, 'label': label, 'count': delta})
+
+    @staticmethod
+    def counts(executor, actor):
+        """returns {label: count} for an actor"""
+        rows = executor.execute(select([_label_count.c.label, _label_count.c.count])
+                                .where(_label_count.c.actor == actor))
+        return {label: count for label, count in rows}
+
+    @staticmethod
+    def rebuild(executor):
+        """recount every actor and label from the status table, without committing"""
+        executor.execute(_label_count.delete())
+        executor.execute(_label_count.insert().from_select(
+            ['actor', 'label', 'count'],
+            select([_status.c.actor, _status.c.label, func.count(_status.c.id)])
+            .group_by(_status.c.actor, _status.c.label)))
+
+    @staticmethod
+    def rebuild_if_missing(session):
+        """count existing statuses when the counts table is empty, as it is when first created"""
+        if session.query(LabelCount.id).first() is None and session.query(Status.id).first() is not None:
+            logger.info("Building label counts from existing statuses")
+            LabelCounter.rebuild(session)
+        session.commit()
+
+
+class MailboxVersions:
+    """Keeps a version per mailbox that changes whenever a write could change what its owner sees"""
+
+    @staticmethod
+    def mailbox(user_urn, survey=None):
+        """the mailbox a user reads, respondents have their own and internal users the survey's.
+        None for an internal user reading every survey"""
+        return user_urn if User(user_urn).is_respondent else survey
+
+    @staticmethod
+    def bump(executor, actors):
+        """increment the version of each actor's mailbox, without committing"""
+        for actor in sorted(set(actors)):
+            if not actor:
+                continue
+            _increment(executor, INCREMENT_VERSION, {'b_actor': actor}, INSERT_VERSION, {'actor': actor, 'version': 1})
+
+    @staticmethod
+    def version(executor, user_urn, survey=None):
+        """returns the current version of the user's mailbox, 0 before its first write.
+        An internal user reading every survey gets the sum of the versions of every mailbox other than
+        a respondent's, which changes whenever any survey's does"""
+        mailbox = MailboxVersions.mailbox(user_urn, survey)
+        if mailbox is None:
+            query = select([func.sum(_mailbox_version.c.version)])\
+                .where(~_mailbox_version.c.actor.contains('respondent'))
+        else:
+            query = select([_mailbox_version.c.version]).where(_mailbox_version.c.actor == mailbox)
+        return executor.execute(query).scalar() or 0
@@ -1,20 +1,38 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index, UniqueConstraint, Table, DDL, event, \
+    inspect
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.schema import CreateTable
 from datetime import datetime, timezone
 from app import constants
 import logging
+from app.repository.pool import PooledSQLAlchemy
 from app.validation.user import User
 
 logger = logging.getLogger(__name__)
 
-db = SQLAlchemy()
+db = PooledSQLAlchemy()
+
+
+def create_missing_indexes(engine):
+    """create declared indexes absent from tables built before they were declared,
+    create_all only adds indexes when it creates the table itself"""
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        existing = [index['name'] for index in inspector.get_indexes(table.name)]
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating missing index {0}".format(index.name))
+                index.create(bind=engine)
 
 
 class SecureMessage(db.Model):
     """Secure messaging database model"""
 
     __tablename__ = "secure_message"
+    __table_args__ = (Index('ix_secure_message_sent_date_id', 'sent_date', 'id'),
+                      Index('ix_secure_message_thread_id_sent_date', 'thread_id', 'sent_date'),
+                      Index('ix_secure_message_survey_sent_date', 'survey', 'sent_date'))
 
     id = Column("id", Integer, primary_key=True)
     msg_id = Column("msg_id", String(constants.MAX_MSG_ID_LEN), unique=True)
@@ -71,13 +89,17 @@ class SecureMessage(db.Model):
             '_links': '',
             'labels': []
         }
+        return SecureMessage.add_statuses(message, self.statuses, user_urn)
 
+    @staticmethod
+    def add_statuses(message, statuses, user_urn):
+        """fill in the labels, recipients and sender of a serialized message from rows with actor and label"""
         if User(user_urn).is_respondent:
             actor = user_urn
         else:
-            actor = self.survey
+            actor = message['survey']
 
-        for row in self.statuses:
+        for row in statuses:
             if row.actor == actor:
                 message['labels'].append(row.label)
 
@@ -92,6 +114,8 @@ class SecureMessage(db.Model):
 class Status(db.Model):
     """Label Assignment table model"""
     __tablename__ = "status"
+    __table_args__ = (Index('ix_status_msg_id_label_actor', 'msg_id', 'label', 'actor'),
+                      Index('ix_status_actor_msg_id', 'actor', 'msg_id'))
 
     id = Column('id', Integer, primary_key=True)
     label = Column('label', String(constants.MAX_STATUS_LABEL_LEN + 1))
@@ -119,6 +143,34 @@ class Status(db.Model):
         return data
 
 
+class LabelCount(db.Model):
+    """Number of status rows per actor and label, kept in step with the status table"""
+    __tablename__ = "label_count"
+    __table_args__ = (UniqueConstraint('actor', 'label', name='uq_label_count_actor_label'),)
+
+    id = Column('id', Integer, primary_key=True)
+    actor = Column('actor', String(constants.MAX_STATUS_ACTOR_LEN + 1), nullable=False)
+    label = Column('label', String(constants.MAX_STATUS_LABEL_LEN + 1), nullable=False)
+    count = Column('count', Integer, nullable=False, default=0)
+
+    def __init__(self, actor='', label='', count=0):
+        self.actor = actor
+        self.label = label
+        self.count = count
+
+
+class MailboxVersion(db.Model):
+    """Version of an actor's mailbox, incremented by every write that changes what the actor sees"""
+    __tablename__ = "mailbox_version"
+
+    actor = Column('actor', String(constants.MAX_STATUS_ACTOR_LEN + 1), primary_key=True)
+    version = Column('version', Integer, nullable=False, default=0)
+
+    def __init__(self, actor='', version=0):
+        self.actor = actor
+        self.version = version
+
+
 class InternalSentAudit(db.Model):
     """Label Assignment table model"""
     __tablename__ = "internal_sent_audit"
@@ -144,3 +196,40 @@ class InternalSentAudit(db.Model):
             'internal_user': self.internal_user
         }
         return data
+
+
+# Full text index over message subject and body, rows share the id of their secure_message row.
+# SQLite builds it as an FTS5 virtual table, or a plain unsearchable table when built without FTS5,
+# Postgres as a plain table with a GIN index over its tsvector
+message_search = Table('message_search', db.metadata,
+                       Column('id', Integer, primary_key=True),
+                       Column('msg_id', String(constants.MAX_MSG_ID_LEN)),
+                       Column('subject', String(constants.MAX_SUBJECT_LEN + 1)),
+                       Column('body', String(constants.MAX_BODY_LEN + 1)))
+
+event.listen(message_search, 'after_create',
+             DDL("CREATE INDEX ix_message_search_document ON message_search USING gin "
+                 "(to_tsvector('english', coalesce(subject, '') || ' ' || coalesce(body, '')))")
+             .execute_if(dialect='postgresql'))
+
+
+def sqlite_has_fts5(connection):
+    """whether the SQLite library behind connection was built with the FTS5 extension"""
+    return 'ENABLE_FTS5' in [row[0] for row in connection.execute('PRAGMA compile_options')]
+
+
+@event.listens_for(message_search, 'before_create')
+def _check_sqlite_fts5(target, connection, **kw):
+    """record on the dialect whether message_search can be created as an FTS5 table"""
+    if connection.dialect.name == 'sqlite':
+        connection.dialect.supports_fts5 = sqlite_has_fts5(connection)
+        if not connection.dialect.supports_fts5:
+            logger.warning("SQLite was built without FTS5, message search is disabled")
+
+
+@compiles(CreateTable, 'sqlite')
+def _create_sqlite_table(element, compiler, **kw):
+    """create message_search as an FTS5 table when SQLite supports it, its id is the FTS5 rowid"""
+    if element.element.name == message_search.name and getattr(compiler.dialect, 'supports_fts5', False):
+        return "CREATE VIRTUAL TABLE message_search USING fts5(msg_id UNINDEXED, subject, body)"
+    return compiler.visit_create_table(element)
@@ -0,0 +1,121 @@
+import json
+import logging
+import threading
+from datetime import datetime
+
+from app import settings
+from app.common.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Fields of a message that are fixed once it is saved, labels and read_date change and are never cached
+CACHED_FIELDS = ['msg_id', 'subject', 'body', 'thread_id', 'sent_date', 'collection_case', 'reporting_unit', 'survey']
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class LocalBackend(LRUCache):
+    """Bounded in-process LRU of cached message fields, MessageCache counts the hits and misses"""
+
+    def __init__(self, max_size=settings.MESSAGE_CACHE_SIZE):
+        super().__init__(max_size)
+
+    def get(self, msg_id):
+        return self._lookup(msg_id)
+
+    def set(self, msg_id, fields):
+        self.put(msg_id, fields)
+
+
+class ExternalBackend:
+    """Keeps cached message fields as json in an external key value store shared by every process.
+    client needs get(key), set(key, value) and delete(key), as memcached and redis clients provide"""
+
+    def __init__(self, client, prefix='secure-message:message:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, msg_id):
+        value = self.client.get(self.prefix + msg_id)
+        if value is None:
+            return None
+        fields = json.loads(value.decode() if isinstance(value, bytes) else value)
+        if fields['sent_date'] is not None:
+            fields['sent_date'] = datetime.strptime(fields['sent_date'], DATE_FORMAT)
+        return fields
+
+    def set(self, msg_id, fields):
+        fields = dict(fields)
+        if fields['sent_date'] is not None:
+            fields['sent_date'] = fields['sent_date'].strftime(DATE_FORMAT)
+        self.client.set(self.prefix + msg_id, json.dumps(fields))
+
+    def delete(self, msg_id):
+        self.client.delete(self.prefix + msg_id)
+
+    def clear(self):
+        """entries in a shared store are left for other processes, only deletes remove them"""
+        pass
+
+
+class ExternalStandIn:
+    """Local stand-in for an external key value store client, holding values in a dict"""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class MessageCache:
+    """Read-through cache of the immutable fields of messages by msg_id.
+    Failures of the backend are logged and treated as misses so the database remains the source of truth"""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, msg_id):
+        """returns a copy of the cached fields of a message, None when not cached"""
+        try:
+            fields = self.backend.get(msg_id)
+        except Exception as e:
+            logger.warning("Message cache get failed {0}".format(e))
+            fields = None
+        with self._lock:
+            if fields is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return dict(fields)
+
+    def put(self, message):
+        """cache the immutable fields of a serialized message"""
+        try:
+            self.backend.set(message['msg_id'], {field: message[field] for field in CACHED_FIELDS})
+        except Exception as e:
+            logger.warning("Message cache put failed {0}".format(e))
+
+    def invalidate(self, msg_id):
+        """drop a message, used when it is deleted"""
+        try:
+            self.backend.delete(msg_id)
+        except Exception as e:
+            logger.warning("Message cache delete failed {0}".format(e))
+
+    def clear(self):
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logger.warning("Message cache clear failed {0}".format(e))
+
+
+message_cache = MessageCache()
@@ -1,13 +1,34 @@
 import logging
-from app.repository.database import db
+from app.repository.counters import LabelCounter, MailboxVersions
+from app.repository.database import db, SecureMessage, Status
+from app.repository.message_cache import message_cache
+from app.repository.search import SearchIndex
 
+from collections import Counter
+from sqlalchemy import and_, bindparam, select
 from werkzeug.exceptions import InternalServerError
 from app.validation.labels import Labels
 from app.validation.user import User
 from datetime import timezone, datetime
-from app.repository.saver import Saver
 logger = logging.getLogger(__name__)
 
+# Statements built once with bound parameters, their compiled form is kept in _compiled_cache so
+# repeated requests skip SQL compilation. Set based statements with an IN list vary in shape and are not cached.
+_status = Status.__table__
+_secure_message = SecureMessage.__table__
+_compiled_cache = {}
+
+INSERT_STATUS = _status.insert()
+DELETE_STATUS = _status.delete().where(and_(_status.c.label == bindparam('b_label'),
+                                            _status.c.msg_id == bindparam('b_msg_id'),
+                                            _status.c.actor == bindparam('b_actor')))
+SET_READ_DATE = _secure_message.update().where(and_(_secure_message.c.msg_id == bindparam('b_msg_id'),
+                                                    _secure_message.c.read_date.is_(None)))\
+    .values(read_date=bindparam('b_read_date'))
+DRAFT_ACTORS = select([_status.c.actor]).where(and_(_status.c.msg_id == bindparam('b_msg_id'),
+                                                    _status.c.label == Labels.DRAFT.value)).distinct()
+DELETE_DRAFT_MESSAGE = _secure_message.delete().where(_secure_message.c.msg_id == bindparam('b_msg_id'))
+
 
 class Modifier:
     """Modifies message to add / remove statuses"""
@@ -15,28 +36,30 @@ class Modifier:
     @staticmethod
     def add_label(label, message, user_urn):
         """add a label to status table"""
-        actor = user_urn if User(user_urn).is_respondent else message['survey']
-        try:
-            query = "INSERT INTO status (label, msg_id, actor) VALUES ('{0}','{1}','{2}')". \
-                format(label, message['msg_id'], actor)
-            db.get_engine(app=db.get_app()).execute(query)
-            return True
-        except Exception as e:
-            logger.error(e)
-            raise (InternalServerError(description="Error retrieving messages from database"))
+        return Modifier.add_label_many(label, [message], user_urn)
+
+    @staticmethod
+    def add_label_many(label, messages, user_urn):
+        """add a label to the status table for every message in one executemany insert"""
+        rows_by_actor = {}
+        for message in messages:
+            actor = Modifier._actor(message, user_urn)
+            rows_by_actor.setdefault(actor, []).append({'label': label, 'msg_id': message['msg_id'], 'actor': actor})
+        if rows_by_actor:
+            Modifier._execute([(INSERT_STATUS, rows, True, (actor, label, len(rows)))
+                               for actor, rows in rows_by_actor.items()], Modifier._participants(messages))
+        return True
 
     @staticmethod
     def remove_label(label, message, user_urn):
         """delete a label from status table"""
-        actor = user_urn if User(user_urn).is_respondent else message['survey']
-        try:
-            query = "DELETE FROM status WHERE label = '{0}' and msg_id = '{1}' and actor = '{2}'". \
-                format(label, message['msg_id'], actor)
-            db.get_engine(app=db.get_app()).execute(query)
-            return True
-        except Exception as e:
-            logger.error(e)
-            raise (InternalServerError(description="Error retrieving messages from database"))
+        return Modifier.remove_label_many(label, [message], user_urn)
+
+    @staticmethod
+    def remove_label_many(label, messages, user_urn):
+        """delete a label from the status table for every message, one statement per actor"""
+        Modifier._execute(Modifier._remove_label_steps(label, messages, user_urn), Modifier._participants(messages))
+        return True
 
     @staticmethod
     def add_archived(message, user_urn):
@@ -66,31 +89,100 @@ class Modifier:
     @staticmethod
     def del_unread(message, user_urn):
         """Remove unread label from status"""
+        return Modifier.del_unread_many([message], user_urn)
+
+    @staticmethod
+    def del_unread_many(messages, user_urn):
+        """Set read date and remove unread label for every unread inbox message in one transaction"""
         inbox = Labels.INBOX.value
         unread = Labels.UNREAD.value
-        if inbox in message['labels'] and unread in message['labels'] and message['read_date'] is None:
-
-            query = "UPDATE secure_message SET read_date = '{0}' WHERE msg_id = '{1}'".format(datetime.now(
-                    timezone.utc), message['msg_id'])
-            try:
-                db.get_engine(app=db.get_app()).execute(query)
-            except Exception as e:
-                logger.error(e)
-                raise (InternalServerError(description="Error retrieving messages from database"))
-            Modifier.remove_label(unread, message, user_urn)
+        unread_messages = [message for message in messages if inbox in message['labels'] and
+                           unread in message['labels'] and message['read_date'] is None]
+        if not unread_messages:
+            return True
+
+        read_date = datetime.now(timezone.utc)
+        msg_ids = [message['msg_id'] for message in unread_messages]
+        if len(msg_ids) == 1:
+            steps = [(SET_READ_DATE, {'b_msg_id': msg_ids[0], 'b_read_date': read_date}, True, None)]
+        else:
+            statement = _secure_message.update().where(and_(_secure_message.c.msg_id.in_(msg_ids),
+                                                            _secure_message.c.read_date.is_(None)))\
+                .values(read_date=read_date)
+            steps = [(statement, {}, False, None)]
+        Modifier._execute(steps + Modifier._remove_label_steps(unread, unread_messages, user_urn),
+                          Modifier._participants(unread_messages))
         return True
 
     @staticmethod
-    def del_draft(draft_id):
-        """Remove draft from status table and secure message table"""
-        del_draft_msg = "DELETE FROM secure_message WHERE msg_id='{0}'".format(draft_id)
-        del_draft_status = "DELETE FROM status WHERE msg_id='{0}' AND label='{1}'".format(draft_id, Labels.DRAFT.value)
-
+    def del_draft(draft_id, commit=True):
+        """Remove draft from status table and secure message table, leaving the commit to the caller if commit is False"""
         try:
-            db.get_engine(app=db.get_app()).execute(del_draft_msg)
-            db.get_engine(app=db.get_app()).execute(del_draft_status)
+            actors = [row[0] for row in db.session.connection().execute(DRAFT_ACTORS, {'b_msg_id': draft_id})]
         except Exception as e:
             logger.error(e)
+            db.session.rollback()
             raise (InternalServerError(description="Error retrieving messages from database"))
+        draft = Labels.DRAFT.value
+        search = SearchIndex.for_dialect(db.session.get_bind().dialect.name)
+        Modifier._execute([(DELETE_STATUS, {'b_label': draft, 'b_msg_id': draft_id, 'b_actor': actor}, True,
+                            (actor, draft, None)) for actor in actors] +
+                          [(search.REMOVE, {'msg_id': draft_id}, True, None),
+                           (DELETE_DRAFT_MESSAGE, {'b_msg_id': draft_id}, True, None)], actors, commit)
+        message_cache.invalidate(draft_id)
+
+    @staticmethod
+    def _actor(message, user_urn):
+        """the status actor for a user, respondents own their labels and internal users share the survey's"""
+        return user_urn if User(user_urn).is_respondent else message['survey']
 
+    @staticmethod
+    def _participants(messages):
+        """the actors holding statuses on the messages, whose mailboxes a change to the messages affects"""
+        actors = set()
+        for message in messages:
+            actors.update(message['urn_to'])
+            actors.add(message['urn_from'])
+        return actors
 
+    @staticmethod
+    def _remove_label_steps(label, messages, user_urn):
+        """build the deletes removing label from messages, grouping message ids by actor"""
+        msg_ids_by_actor = {}
+        for message in messages:
+            msg_ids_by_actor.setdefault(Modifier._actor(message, user_urn), []).append(message['msg_id'])
+
+        steps = []
+        for actor, msg_ids in msg_ids_by_actor.items():
+            if len(msg_ids) == 1:
+                steps.append((DELETE_STATUS, {'b_label': label, 'b_msg_id': msg_ids[0], 'b_actor': actor}, True,
+                              (actor, label, None)))
+            else:
+                statement = _status.delete().where(and_(_status.c.label == label, _status.c.actor == actor,
+                                                        _status.c.msg_id.in_(msg_ids)))
+                steps.append((statement, {}, False, (actor, label, None)))
+        return steps
+
+    @staticmethod
+    def _execute(steps, mailboxes, commit=True):
+        """run (statement, params, prepared, counted) steps on the session connection and commit them together
+        with a bump to the versions of the mailboxes they change, unless commit is False.
+        counted is None or the (actor, label, change) applied to the label counts, a change of None
+        subtracts the rows the statement deleted"""
+        try:
+            connection = db.session.connection()
+            prepared_connection = connection.execution_options(compiled_cache=_compiled_cache)
+            deltas = Counter()
+            for statement, params, prepared, counted in steps:
+                result = (prepared_connection if prepared else connection).execute(statement, params)
+                if counted is not None:
+                    actor, label, change = counted
+                    deltas[(actor, label)] += -result.rowcount if change is None else change
+            LabelCounter.adjust(connection, deltas)
+            MailboxVersions.bump(connection, set(mailboxes) | {actor for actor, _ in deltas})
+            if commit:
+                db.session.commit()
+        except Exception as e:
+            logger.error(e)
+            db.session.rollback()
+            raise (InternalServerError(description="Error retrieving messages from database"))
@@ -0,0 +1,42 @@
+import logging
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Options only a QueuePool accepts, SQLite's default pools and NullPool reject them
+QUEUE_OPTIONS = ['pool_size', 'max_overflow', 'pool_timeout']
+POOL_CLASSES = ['queue', 'null']
+
+
+def ping_connection(dbapi_connection, connection_record, connection_proxy):
+    """checkout listener testing a pooled connection before use. A connection left stale by a restart or
+    failover raises DisconnectionError, so the pool discards it and checks out a new one"""
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+    except Exception as e:
+        logger.warning("Discarding stale pooled connection: {0}".format(e))
+        raise exc.DisconnectionError()
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with the pool options it does not support itself.
+    SQLALCHEMY_POOL_CLASS 'null' opens a connection per checkout and SQLALCHEMY_POOL_PRE_PING pings pooled
+    connections on checkout, the pre_ping of later SQLAlchemy versions"""
+
+    def apply_pool_defaults(self, app, options):
+        super().apply_pool_defaults(app, options)
+        if app.config.get('SQLALCHEMY_POOL_CLASS') == 'null':
+            options['poolclass'] = NullPool
+        elif app.config.get('SQLALCHEMY_POOL_PRE_PING'):
+            options['pool_events'] = [(ping_connection, 'checkout')]
+
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+        if info.drivername.startswith('sqlite') or options.get('poolclass') is NullPool:
+            for option in QUEUE_OPTIONS:
+                options.pop(option, None)
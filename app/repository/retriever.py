@@ -1,36 +1,274 @@
 import logging
 
 from flask import jsonify
+from sqlalchemy import and_, func, or_
 from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.exceptions import InternalServerError, NotFound
+from sqlalchemy.orm import joinedload, noload, subqueryload
+from sqlalchemy.orm.attributes import set_committed_value
+from werkzeug.exceptions import InternalServerError, NotFound, ServiceUnavailable
 
-from app.repository.database import SecureMessage
+from app import settings
+from app.common.lru import LRUCache
+from app.repository.counters import LabelCounter, MailboxVersions
+from app.repository.database import db, SecureMessage, Status
+from app.repository.message_cache import message_cache
+from app.repository.search import SearchIndex
+from app.validation.user import User
 
 logger = logging.getLogger(__name__)
 
 
+class Page:
+    """Page of messages along with whether neighbouring pages exist and the total, None when not counted"""
+
+    def __init__(self, items, has_next, has_prev, total=None):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+
+
+class TotalCache(LRUCache):
+    """Bounded LRU of message totals per user, each kept for ttl seconds so list pages
+    can report an approximate total without counting on every request"""
+
+    def __init__(self, max_size=settings.MESSAGE_LIST_TOTAL_CACHE_SIZE, ttl=settings.MESSAGE_LIST_TOTAL_TTL):
+        super().__init__(max_size, ttl)
+
+    def get(self, key, count):
+        """returns the cached total for key, calling count to refresh it when absent or expired"""
+        total = super().get(key)
+        if total is None:
+            total = count()
+            self.put(key, total)
+        return total
+
+
+total_cache = TotalCache()
+
+
+class KeysetPage:
+    """Page of messages fetched by keyset along with whether neighbouring pages exist"""
+
+    def __init__(self, items, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+
 class Retriever:
     """Created when retrieving messages"""
     @staticmethod
-    def retrieve_message_list(page, limit):
-        """returns list of messages from db"""
+    def retrieve_message_list(page, limit, user_urn, total=settings.MESSAGE_LIST_TOTAL, filters=None):
+        """returns a page of messages visible to the user from db, narrowed by the optional filters dict.
+        Unless total is 'exact' one row more than the limit is fetched to tell whether a next page exists,
+        avoiding a count query. With total 'approximate' the page carries a count cached per user"""
         db_model = SecureMessage()
+        query = db_model.query.options(subqueryload(SecureMessage.statuses))\
+            .filter(*Retriever._list_filters(user_urn, filters))\
+            .order_by('sent_date desc')
+
+        try:
+            if total == 'exact':
+                result = query.paginate(page, limit, False)
+                return True, Page(result.items, result.has_next, result.has_prev, result.total)
+
+            rows = query.offset((page - 1) * limit).limit(limit + 1).all()
+            approximate_total = None
+            if total == 'approximate':
+                key = (user_urn, tuple(sorted((filters or {}).items())))
+                approximate_total = total_cache.get(key, lambda: Retriever.count_messages(user_urn, filters))
+        except Exception as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving messages from database"))
+
+        return True, Page(rows[:limit], len(rows) > limit, page > 1, approximate_total)
+
+    @staticmethod
+    def count_messages(user_urn, filters=None):
+        """returns the number of messages visible to the user matching the optional filters"""
+        return db.session.query(func.count(SecureMessage.id))\
+            .filter(*Retriever._list_filters(user_urn, filters)).scalar()
+
+    @staticmethod
+    def retrieve_message_list_by_cursor(cursor, limit, user_urn, filters=None):
+        """returns a keyset page of messages visible to the user, newest first, narrowed by the optional filters.
+        cursor is None for the first page, otherwise a (direction, sent_date, id) tuple
+        where direction is 'next' for older messages and 'prev' for newer ones"""
+        db_model = SecureMessage()
+        query = db_model.query.options(subqueryload(SecureMessage.statuses))\
+            .filter(*Retriever._list_filters(user_urn, filters))
+
+        backwards = cursor is not None and cursor[0] == 'prev'
+        if backwards:
+            query = query.filter(Retriever._newer_than(cursor[1], cursor[2]))\
+                .order_by(SecureMessage.sent_date.asc().nullsfirst(), SecureMessage.id.asc())
+        else:
+            if cursor is not None:
+                query = query.filter(Retriever._older_than(cursor[1], cursor[2]))
+            query = query.order_by(SecureMessage.sent_date.desc().nullslast(), SecureMessage.id.desc())
 
         try:
-            result = db_model.query.order_by('sent_date desc').paginate(page, limit, False)
+            rows = query.limit(limit + 1).all()
         except Exception as e:
             logger.error(e)
             raise(InternalServerError(description="Error retrieving messages from database"))
 
-        return True, result
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            return True, KeysetPage(list(reversed(rows)), True, more)
+        return True, KeysetPage(rows, more, cursor is not None)
+
+    @staticmethod
+    def search_messages(words, page, limit, user_urn):
+        """returns a page of messages visible to the user whose subject or body hold every word, best match first"""
+        matches = SearchIndex.matches(db.session.get_bind().dialect.name, words)
+
+        try:
+            if not SearchIndex.available(db.session):
+                raise ServiceUnavailable(description="Message search is not available on this database")
+            rows = SecureMessage.query.options(subqueryload(SecureMessage.statuses))\
+                .join(matches, matches.c.msg_id == SecureMessage.msg_id)\
+                .filter(Retriever._actor_filter(user_urn))\
+                .order_by(matches.c.rank.desc(), SecureMessage.sent_date.desc(), SecureMessage.id.desc())\
+                .offset((page - 1) * limit).limit(limit + 1).all()
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error searching messages in database"))
+
+        return True, Page(rows[:limit], len(rows) > limit, page > 1)
+
+    @staticmethod
+    def retrieve_thread(thread_id, user_urn):
+        """returns the messages of a thread visible to the user from db, oldest first"""
+        db_model = SecureMessage()
+
+        try:
+            result = db_model.query.options(subqueryload(SecureMessage.statuses))\
+                .filter(SecureMessage.thread_id == thread_id)\
+                .filter(Retriever._actor_filter(user_urn))\
+                .order_by(SecureMessage.sent_date.asc(), SecureMessage.id.asc()).all()
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving thread from database"))
+
+        if not result:
+            raise (NotFound(description="Thread with thread_id '{0}' does not exist".format(thread_id)))
+
+        return result
+
+    @staticmethod
+    def retrieve_thread_list(page, limit, user_urn):
+        """returns a page of the latest message in each thread visible to the user, newest first.
+        The latest message per thread is picked by a row_number window over the thread in one query"""
+        ranked = db.session.query(SecureMessage.id.label('id'),
+                                  func.row_number().over(partition_by=SecureMessage.thread_id,
+                                                         order_by=(SecureMessage.sent_date.desc(),
+                                                                   SecureMessage.id.desc())).label('position'))\
+            .filter(Retriever._actor_filter(user_urn)).subquery()
+
+        try:
+            rows = SecureMessage.query.options(subqueryload(SecureMessage.statuses))\
+                .join(ranked, SecureMessage.id == ranked.c.id)\
+                .filter(ranked.c.position == 1)\
+                .order_by(SecureMessage.sent_date.desc(), SecureMessage.id.desc())\
+                .offset((page - 1) * limit).limit(limit + 1).all()
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving threads from database"))
+
+        return True, Page(rows[:limit], len(rows) > limit, page > 1)
+
+    @staticmethod
+    def retrieve_message_stream(user_urn, batch_size=settings.MESSAGE_EXPORT_BATCH_SIZE):
+        """yields every message visible to the user, newest first, with statuses loaded.
+        Messages are read through a streaming cursor batch_size rows at a time and the statuses of
+        each batch are loaded in one query, so memory use does not grow with the mailbox"""
+        db_model = SecureMessage()
+        query = db_model.query.options(noload(SecureMessage.statuses))\
+            .filter(Retriever._actor_filter(user_urn))\
+            .order_by(SecureMessage.sent_date.desc().nullslast(), SecureMessage.id.desc())\
+            .execution_options(stream_results=True).yield_per(batch_size)
+
+        try:
+            batch = []
+            for message in query:
+                batch.append(message)
+                if len(batch) == batch_size:
+                    yield from Retriever._with_statuses(batch)
+                    batch = []
+            yield from Retriever._with_statuses(batch)
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving messages from database"))
+
+    @staticmethod
+    def _with_statuses(messages):
+        """loads the statuses of a batch of messages in one query and attaches them to each message"""
+        if not messages:
+            return []
+        statuses = {message.msg_id: [] for message in messages}
+        for status in Status.query.filter(Status.msg_id.in_(list(statuses))).all():
+            statuses[status.msg_id].append(status)
+        for message in messages:
+            set_committed_value(message, 'statuses', statuses[message.msg_id])
+        return messages
+
+    @staticmethod
+    def _older_than(sent_date, row_id):
+        """criterion for rows after (sent_date, id) in newest first order, unsent rows sort last"""
+        if sent_date is None:
+            return and_(SecureMessage.sent_date.is_(None), SecureMessage.id < row_id)
+        return or_(SecureMessage.sent_date < sent_date,
+                   and_(SecureMessage.sent_date == sent_date, SecureMessage.id < row_id),
+                   SecureMessage.sent_date.is_(None))
+
+    @staticmethod
+    def _newer_than(sent_date, row_id):
+        """criterion for rows before (sent_date, id) in newest first order, unsent rows sort last"""
+        if sent_date is None:
+            return or_(SecureMessage.sent_date.isnot(None),
+                       and_(SecureMessage.sent_date.is_(None), SecureMessage.id > row_id))
+        return or_(SecureMessage.sent_date > sent_date,
+                   and_(SecureMessage.sent_date == sent_date, SecureMessage.id > row_id))
+
+    @staticmethod
+    def _actor_filter(user_urn, label=None):
+        """returns criterion matching messages with a status row for the user's actor, with the label if given.
+        Respondents are labelled by their own urn, internal users by the message survey"""
+        if User(user_urn).is_respondent:
+            actor = Status.actor == user_urn
+        else:
+            actor = Status.actor == SecureMessage.survey
+        if label is None:
+            return SecureMessage.statuses.any(actor)
+        return SecureMessage.statuses.any(and_(actor, Status.label == label))
+
+    @staticmethod
+    def _list_filters(user_urn, filters):
+        """returns the criteria for a message list, the user's actor filter narrowed by a filters dict
+        with any of label, survey, reporting_unit and collection_case"""
+        filters = filters or {}
+        criteria = [Retriever._actor_filter(user_urn, filters.get('label'))]
+        for name in ['survey', 'reporting_unit', 'collection_case']:
+            if filters.get(name) is not None:
+                criteria.append(getattr(SecureMessage, name) == filters[name])
+        return criteria
 
     @staticmethod
     def retrieve_message(message_id, user_urn):
-        """returns single message from db"""
+        """returns single message from db.
+        The fixed fields of a message are read through the message cache, its read date and statuses
+        are always read fresh so label changes made by any process are seen"""
+        cached = message_cache.get(message_id)
+        if cached is not None:
+            return Retriever._merge_fresh_fields(cached, user_urn)
+
         db_model = SecureMessage()
 
         try:
-            result = db_model.query.filter_by(msg_id=message_id).first()
+            result = db_model.query.options(joinedload(SecureMessage.statuses)).filter_by(msg_id=message_id).first()
             if result is None:
                 raise (NotFound(description="Message with msg_id '{0}' does not exist".format(message_id)))
         except SQLAlchemyError as e:
@@ -38,9 +276,73 @@ class Retriever:
             raise(InternalServerError(description="Error retrieving message from database"))
 
         message = result.serialize(user_urn)
+        message_cache.put(message)
 
         return message
 
+    @staticmethod
+    def _merge_fresh_fields(message, user_urn):
+        """completes cached message fields with the read date and statuses read in one query"""
+        try:
+            rows = db.session.query(SecureMessage.read_date, Status.actor, Status.label)\
+                .outerjoin(Status, Status.msg_id == SecureMessage.msg_id)\
+                .filter(SecureMessage.msg_id == message['msg_id']).all()
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving message from database"))
+
+        if not rows:
+            message_cache.invalidate(message['msg_id'])
+            raise (NotFound(description="Message with msg_id '{0}' does not exist".format(message['msg_id'])))
+
+        message.update({'urn_to': [], 'urn_from': '', 'read_date': rows[0].read_date, '_links': '', 'labels': []})
+        return SecureMessage.add_statuses(message, [row for row in rows if row.actor is not None], user_urn)
+
+    @staticmethod
+    def retrieve_messages(message_ids, user_urn):
+        """returns the messages with the given ids from db keyed by msg_id, missing ids are left out"""
+        db_model = SecureMessage()
+
+        try:
+            result = db_model.query.options(subqueryload(SecureMessage.statuses))\
+                .filter(SecureMessage.msg_id.in_(message_ids)).all()
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving messages from database"))
+
+        return {message.msg_id: message.serialize(user_urn) for message in result}
+
+    @staticmethod
+    def retrieve_label_counts(actor):
+        """returns {label: count} of the actor's statuses from the label counts, without reading messages"""
+        try:
+            return LabelCounter.counts(db.session, actor)
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving message counts from database"))
+
+    @staticmethod
+    def retrieve_mailbox_version(user_urn, survey=None):
+        """returns the version of the mailbox the user reads, it changes with every write the user could see.
+        survey narrows an internal user's mailbox to that survey's messages"""
+        try:
+            return MailboxVersions.version(db.session, user_urn, survey)
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving mailbox version from database"))
+
+    @staticmethod
+    def retrieve_message_survey(message_id):
+        """returns the survey of a message read through the message cache, None when it does not exist"""
+        cached = message_cache.get(message_id)
+        if cached is not None:
+            return cached['survey']
+        try:
+            return db.session.query(SecureMessage.survey).filter(SecureMessage.msg_id == message_id).scalar()
+        except SQLAlchemyError as e:
+            logger.error(e)
+            raise(InternalServerError(description="Error retrieving messages from database"))
+
     @staticmethod
     def check_db_connection():
         """checks if db connection is working"""
@@ -2,16 +2,20 @@ import logging
 
 from app.exception.exceptions import MessageSaveException
 from app.repository import database
+from app.repository.counters import LabelCounter, MailboxVersions
+from app.repository.search import SearchIndex
 from app.repository.database import db
 
 logger = logging.getLogger(__name__)
 
 
 class Saver:
-    """Created when saving a message"""
+    """Created when saving a message.
+    Each save method commits by default, pass commit=False to stage the row and call commit once for the batch.
+    Staged statuses leave their mailbox versions to commit, which bumps each mailbox passed to it once"""
 
     @staticmethod
-    def save_message(domain_message, sent_date=None, session=db.session):
+    def save_message(domain_message, sent_date=None, session=db.session, commit=True):
         """save message to database"""
 
         db_message = database.SecureMessage()
@@ -19,32 +23,84 @@ class Saver:
         db_message.set_from_domain_model(domain_message)
         try:
             session.add(db_message)
-            session.commit()
+            session.flush()
+            SearchIndex.add(session, [db_message.msg_id])
+            if commit:
+                session.commit()
         except Exception as e:
             logger.error("Message save failed {0}".format(e))
+            session.rollback()
             raise MessageSaveException(e)
 
     @staticmethod
-    def save_msg_status(msg_urn, msg_id, label, session=db.session):
-        """save message status to database"""
+    def save_msg_status(msg_urn, msg_id, label, session=db.session, commit=True):
+        """save message status to database, bumping the actor's mailbox version only when committing"""
 
         db_status_to = database.Status()
         db_status_to.set_from_domain_model(msg_id, msg_urn, label)
         try:
             session.add(db_status_to)
-            session.commit()
+            LabelCounter.adjust(session, {(msg_urn, label): 1})
+            if commit:
+                MailboxVersions.bump(session, [msg_urn])
+                session.commit()
         except Exception as e:
             logger.error("Message status save failed {}".format(e))
+            session.rollback()
             raise MessageSaveException(e)
 
     @staticmethod
-    def save_msg_audit(msg_id, msg_urn, session=db.session):
+    def save_msg_audit(msg_id, msg_urn, session=db.session, commit=True):
         """Save Sent Audit data to database"""
         db_audit = database.InternalSentAudit()
         db_audit.set_from_domain_model(msg_id, msg_urn)
         try:
             session.add(db_audit)
-            session.commit()
+            if commit:
+                session.commit()
         except Exception as e:
             logger.error("Message audit save failed {}".format(e))
+            session.rollback()
+            raise MessageSaveException(e)
+
+    @staticmethod
+    def save_messages_bulk(domain_messages, sent_date, statuses, audits, session=db.session):
+        """save many messages with their statuses and audits as executemany inserts in one transaction.
+        statuses are (msg_urn, msg_id, label) tuples and audits are (msg_id, msg_urn) tuples"""
+        message_rows = []
+        for domain_message in domain_messages:
+            domain_message.sent_date = sent_date
+            message_rows.append({'msg_id': domain_message.msg_id, 'subject': domain_message.subject,
+                                 'body': domain_message.body, 'thread_id': domain_message.thread_id,
+                                 'sent_date': domain_message.sent_date, 'read_date': domain_message.read_date,
+                                 'collection_case': domain_message.collection_case,
+                                 'reporting_unit': domain_message.reporting_unit, 'survey': domain_message.survey})
+        status_rows = [{'actor': msg_urn, 'msg_id': msg_id, 'label': label} for msg_urn, msg_id, label in statuses]
+        audit_rows = [{'msg_id': msg_id, 'internal_user': msg_urn} for msg_id, msg_urn in audits]
+
+        try:
+            session.execute(database.SecureMessage.__table__.insert(), message_rows)
+            SearchIndex.add(session, [row['msg_id'] for row in message_rows])
+            if status_rows:
+                session.execute(database.Status.__table__.insert(), status_rows)
+                LabelCounter.adjust(session, LabelCounter.deltas((msg_urn, label) for msg_urn, _, label in statuses))
+                MailboxVersions.bump(session, [msg_urn for msg_urn, _, _ in statuses])
+            if audit_rows:
+                session.execute(database.InternalSentAudit.__table__.insert(), audit_rows)
+            session.commit()
+        except Exception as e:
+            logger.error("Bulk message save failed {}".format(e))
+            session.rollback()
+            raise MessageSaveException(e)
+
+    @staticmethod
+    def commit(session=db.session, mailboxes=()):
+        """commit all staged rows in one transaction with a bump to the versions of the mailboxes they change,
+        nothing is written if any row fails"""
+        try:
+            MailboxVersions.bump(session, mailboxes)
+            session.commit()
+        except Exception as e:
+            logger.error("Message commit failed {}".format(e))
+            session.rollback()
             raise MessageSaveException(e)
@@ -0,0 +1,88 @@
+import logging
+import re
+
+from sqlalchemy import Float, String, text
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteSearch:
+    """Full text search on an SQLite FTS5 table ranked by bm25"""
+
+    ADD = text("INSERT INTO message_search(rowid, msg_id, subject, body) "
+               "SELECT id, msg_id, subject, body FROM secure_message WHERE msg_id = :msg_id")
+    REMOVE = text("DELETE FROM message_search WHERE rowid = (SELECT id FROM secure_message WHERE msg_id = :msg_id)")
+    REBUILD = text("INSERT INTO message_search(rowid, msg_id, subject, body) "
+                   "SELECT id, msg_id, subject, body FROM secure_message")
+    MATCHES = text("SELECT msg_id, -bm25(message_search) AS rank FROM message_search "
+                   "WHERE message_search MATCH :terms")
+
+    @staticmethod
+    def terms(words):
+        """quote each word so user input is never read as FTS5 query syntax"""
+        return ' '.join('"{0}"'.format(word) for word in words)
+
+
+class PostgresSearch:
+    """Full text search on a Postgres tsvector ranked by ts_rank"""
+
+    DOCUMENT = "to_tsvector('english', coalesce(subject, '') || ' ' || coalesce(body, ''))"
+    ADD = text("INSERT INTO message_search(id, msg_id, subject, body) "
+               "SELECT id, msg_id, subject, body FROM secure_message WHERE msg_id = :msg_id")
+    REMOVE = text("DELETE FROM message_search WHERE id = (SELECT id FROM secure_message WHERE msg_id = :msg_id)")
+    REBUILD = text("INSERT INTO message_search(id, msg_id, subject, body) "
+                   "SELECT id, msg_id, subject, body FROM secure_message")
+    MATCHES = text("SELECT msg_id, ts_rank({0}, plainto_tsquery('english', :terms)) AS rank FROM message_search "
+                   "WHERE {0} @@ plainto_tsquery('english', :terms)".format(DOCUMENT))
+
+    @staticmethod
+    def terms(words):
+        return ' '.join(words)
+
+
+class SearchIndex:
+    """Keeps the message_search index in step with secure_message and finds messages by their words"""
+
+    @staticmethod
+    def for_dialect(name):
+        return PostgresSearch if name == 'postgresql' else SqliteSearch
+
+    @staticmethod
+    def _backend(executor):
+        return SearchIndex.for_dialect(executor.get_bind().dialect.name if hasattr(executor, 'get_bind')
+                                       else executor.dialect.name)
+
+    @staticmethod
+    def add(executor, msg_ids):
+        """index the subject and body of the flushed messages with msg_ids, without committing"""
+        if msg_ids:
+            executor.execute(SearchIndex._backend(executor).ADD, [{'msg_id': msg_id} for msg_id in msg_ids])
+
+    @staticmethod
+    def available(executor):
+        """whether message_search can be searched, it is a plain table on SQLite built without FTS5"""
+        if SearchIndex._backend(executor) is PostgresSearch:
+            return True
+        sql = executor.execute(text("SELECT sql FROM sqlite_master WHERE name = 'message_search'")).scalar()
+        return sql is not None and 'fts5' in sql.lower()
+
+    @staticmethod
+    def words(query):
+        """the words of a search query, punctuation and operators are ignored"""
+        return re.findall(r'\w+', query or '')
+
+    @staticmethod
+    def matches(dialect_name, words):
+        """returns a selectable of (msg_id, rank) for messages containing every word, a higher rank is a better match"""
+        backend = SearchIndex.for_dialect(dialect_name)
+        return backend.MATCHES.bindparams(terms=backend.terms(words))\
+            .columns(msg_id=String, rank=Float).alias('matches')
+
+    @staticmethod
+    def rebuild_if_missing(session):
+        """index existing messages when the index is empty, as it is when first created"""
+        if session.execute(text("SELECT 1 FROM message_search LIMIT 1")).first() is None and \
+                session.execute(text("SELECT 1 FROM secure_message LIMIT 1")).first() is not None:
+            logger.info("Building search index from existing messages")
+            session.execute(SearchIndex._backend(session).REBUILD)
+        session.commit()
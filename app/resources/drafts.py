@@ -31,18 +31,23 @@ class Drafts(Resource):
 
     @staticmethod
     def save_draft(draft, saver=Saver()):
-        saver.save_message(draft.data)
+        saver.save_message(draft.data, commit=False)
+        mailboxes = []
 
         if draft.data.urn_to is not None and len(draft.data.urn_to) != 0:
-            Drafts._save_draft_status(saver, draft.data.msg_id, draft.data.urn_to, draft.data.survey,
-                                      Labels.DRAFT.value)
+            mailboxes.append(Drafts._save_draft_status(saver, draft.data.msg_id, draft.data.urn_to,
+                                                       draft.data.survey, Labels.DRAFT.value))
 
-        Drafts._save_draft_status(saver, draft.data.msg_id, draft.data.urn_from, draft.data.survey, Labels.DRAFT.value)
+        mailboxes.append(Drafts._save_draft_status(saver, draft.data.msg_id, draft.data.urn_from, draft.data.survey,
+                                                   Labels.DRAFT.value))
+        saver.commit(mailboxes=mailboxes)
 
     @staticmethod
     def _save_draft_status(saver, msg_id, person, survey, label):
-        """Save labels with correct actor for internal and respondent"""
+        """Save labels with correct actor for internal and respondent, returns the actor or None if not saved"""
 
         actor = survey if User(person).is_internal else person
         if person is not None and len(person) != 0:
-            saver.save_msg_status(actor, msg_id, label)
+            saver.save_msg_status(actor, msg_id, label, commit=False)
+            return actor
+        return None
@@ -1,8 +1,15 @@
 from flask_restful import Resource
-from flask import jsonify
-from app.repository.retriever import Retriever
+from flask import jsonify, Response
+from app.authentication.authenticator import token_cache
+from app.common.alerts import alert_dispatcher
+from app.common.metrics import metrics, Exposition
+from app.repository import database
+from app.repository.message_cache import message_cache
+from app.repository.retriever import Retriever, total_cache
 from app import settings
 
+POOL_GAUGES = ['size', 'checkedin', 'checkedout', 'overflow']
+
 
 class Health(Resource):
 
@@ -42,3 +49,55 @@ class HealthDetails(Resource):
                    }
 
         return jsonify(details)
+
+
+class Metrics(Resource):
+
+    """Rest endpoint exposing in process metrics in the Prometheus text format"""
+
+    @staticmethod
+    def get():
+        """returns request, database pool, token decryption, notification and cache metrics"""
+        requests, request_seconds, pool_events = metrics.snapshot()
+        exposition = Exposition()
+        exposition.counter('secure_message_requests_total', 'Requests handled per resource, method and status',
+                           [({'resource': resource, 'method': method, 'status': status}, count)
+                            for (resource, method, status), count in sorted(requests.items())])
+        exposition.histogram('secure_message_request_duration_seconds', 'Request latency per resource and method',
+                             [({'resource': resource, 'method': method}, histogram)
+                              for (resource, method), histogram in sorted(request_seconds.items())])
+
+        pool = database.db.engine.pool
+        exposition.gauge('secure_message_db_pool_info', 'The class of the database pool',
+                         [({'pool_class': type(pool).__name__}, 1)])
+        exposition.gauge('secure_message_db_pool', 'Connections in the database pool by state',
+                         [({'state': name}, getattr(pool, name)()) for name in POOL_GAUGES if hasattr(pool, name)])
+        exposition.counter('secure_message_db_pool_checkouts_total', 'Connections checked out of the pool',
+                           [({}, pool_events.get('checkout', 0))])
+        exposition.counter('secure_message_db_pool_connects_total', 'Database connections opened by the pool',
+                           [({}, pool_events.get('connect', 0))])
+        exposition.counter('secure_message_db_pool_invalidations_total',
+                           'Connections discarded as stale or after a disconnect error',
+                           [({}, pool_events.get('invalidate', 0))])
+
+        exposition.histogram('secure_message_token_decrypt_seconds', 'Time to decrypt a token',
+                             [({}, metrics.decrypt_seconds)])
+
+        exposition.gauge('secure_message_notification_queue_depth', 'Alerts waiting to be sent',
+                         [({}, alert_dispatcher.queue_depth)])
+        exposition.counter('secure_message_notifications_total', 'Alerts sent or failed after retries',
+                           [({'outcome': 'sent'}, alert_dispatcher.sent_count),
+                            ({'outcome': 'failed'}, alert_dispatcher.failed_count)])
+
+        caches = [('token', token_cache), ('list_total', total_cache), ('message', message_cache)]
+        exposition.counter('secure_message_cache_requests_total', 'Cache lookups by cache and result',
+                           [({'cache': name, 'result': result}, count) for name, cache in caches
+                            for result, count in (('hit', cache.hits), ('miss', cache.misses))])
+        exposition.gauge('secure_message_cache_hit_ratio', 'Share of cache lookups that were hits',
+                         [({'cache': name}, Metrics._ratio(cache.hits, cache.misses)) for name, cache in caches])
+
+        return Response(exposition.text(), content_type=Exposition.CONTENT_TYPE)
+
+    @staticmethod
+    def _ratio(hits, misses):
+        return hits / (hits + misses) if hits + misses else 0.0
@@ -1,25 +1,33 @@
 # from app.authentication.jwt import decode
 from flask_restful import Resource
-from flask import request, jsonify, json
+from flask import request, jsonify, json, Response, stream_with_context
 from werkzeug.exceptions import BadRequest
 from json import load
 from app.repository.modifier import Modifier
 from app.validation.domain import MessageSchema
 from app.repository.saver import Saver
+from app.repository.search import SearchIndex
 from app.repository.retriever import Retriever
 from app.repository.database import Status
 import logging
-from app.common.alerts import AlertUser
-from app import settings
+from app.common.alerts import alert_dispatcher
+from app.common.etags import mailbox_etag, not_modified
+from app import constants, settings
 from app.settings import MESSAGE_QUERY_LIMIT
 from app.validation.labels import Labels
 from app.validation.user import User
 from datetime import timezone, datetime
+import base64
+import binascii
+from urllib.parse import urlencode
 
 logger = logging.getLogger(__name__)
 
 MESSAGE_LIST_ENDPOINT = "messages"
+MESSAGE_SEARCH_ENDPOINT = "messages/search"
 MESSAGE_BY_ID_ENDPOINT = "message"
+CURSOR_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+MESSAGE_LIST_FILTERS = ['label', 'survey', 'reporting_unit', 'collection_case']
 
 """Rest endpoint for message resources. Messages are immutable, they can only be created."""
 
@@ -33,48 +41,212 @@ class MessageList(Resource):
         res = {'status': "ok"}
         if res == {'status': "ok"}:
             page = 1
-            limit = MESSAGE_QUERY_LIMIT
+            limit = int(MESSAGE_QUERY_LIMIT)
+            user_urn = request.headers.get('user_urn')
+            message_service = Retriever()
+            filters = MessageList._filters(request.args)
+
+            etag = mailbox_etag(message_service.retrieve_mailbox_version(user_urn, filters.get('survey')), user_urn,
+                                request.url)
+            unchanged = not_modified(etag)
+            if unchanged is not None:
+                return unchanged
+
+            if 'cursor' in request.args:
+                if request.args.get('limit'):
+                    limit = int(request.args.get('limit'))
+                cursor = request.args.get('cursor')
+                status, result = message_service.retrieve_message_list_by_cursor(MessageList._decode_cursor(cursor),
+                                                                                 limit, user_urn, filters)
+                if status:
+                    resp = MessageList._keyset_list_to_json(result, cursor, limit, request.host_url, user_urn,
+                                                            filters)
+                    resp.status_code = 200
+                    resp.set_etag(etag)
+                    return resp
 
             if request.args.get('limit') and request.args.get('page'):
                 page = int(request.args.get('page'))
                 limit = int(request.args.get('limit'))
 
-            message_service = Retriever()
-            status, result = message_service.retrieve_message_list(page, limit)
+            status, result = message_service.retrieve_message_list(page, limit, user_urn, filters=filters)
             if status:
-                resp = MessageList._paginated_list_to_json(result, page, limit, request.host_url,
-                                                           request.headers.get('user_urn'))
+                resp = MessageList._paginated_list_to_json(result, page, limit, request.host_url, user_urn,
+                                                           filters=filters)
                 resp.status_code = 200
+                resp.set_etag(etag)
                 return resp
         else:
             return res
 
     @staticmethod
-    def _paginated_list_to_json(paginated_list, page, limit, host_url, user_urn):
-        """used to change a pagination object to json format with links"""
+    def _filters(args):
+        """used to read the list filters present in the query string into a dict"""
+        filters = {name: args.get(name) for name in MESSAGE_LIST_FILTERS if args.get(name)}
+        if 'label' in filters and filters['label'] not in Labels.label_list.value:
+            raise BadRequest(description="Invalid label provided: {0}".format(filters['label']))
+        return filters
+
+    @staticmethod
+    def _filter_query(filters):
+        """used to carry list filters into links, empty when there are none"""
+        if not filters:
+            return ''
+        return '&' + urlencode(sorted(filters.items()))
+
+    @staticmethod
+    def _messages_to_json(items, host_url, user_urn):
+        """used to serialize a page of messages keyed by their position in the page"""
         messages = {}
         msg_count = 0
-        for message in paginated_list.items:
+        for message in items:
             msg_count += 1
             msg = message.serialize(user_urn)
             msg['_links'] = {"self": {"href": "{0}{1}/{2}".format(host_url, MESSAGE_BY_ID_ENDPOINT, msg['msg_id'])}}
             messages["{0}".format(msg_count)] = msg
+        return messages
+
+    @staticmethod
+    def _paginated_list_to_json(paginated_list, page, limit, host_url, user_urn, endpoint=MESSAGE_LIST_ENDPOINT,
+                                filters=None):
+        """used to change a pagination object to json format with links, links keep any list filters"""
+        messages = MessageList._messages_to_json(paginated_list.items, host_url, user_urn)
+        query = MessageList._filter_query(filters)
+        link = "{0}{1}?page={2}&limit={3}{4}"
 
         links = {
-            'first': {"href": "{0}{1}".format(host_url, "messages")},
-            'self': {"href": "{0}{1}?page={2}&limit={3}".format(host_url, MESSAGE_LIST_ENDPOINT, page, limit)}
+            'first': {"href": "{0}{1}{2}".format(host_url, endpoint, query.replace('&', '?', 1))},
+            'self': {"href": link.format(host_url, endpoint, page, limit, query)}
         }
 
         if paginated_list.has_next:
-            links['next'] = {
-                "href": "{0}{1}?page={2}&limit={3}".format(host_url, MESSAGE_LIST_ENDPOINT, (page + 1), limit)}
+            links['next'] = {"href": link.format(host_url, endpoint, (page + 1), limit, query)}
 
         if paginated_list.has_prev:
-            links['prev'] = {
-                "href": "{0}{1}?page={2}&limit={3}".format(host_url, MESSAGE_LIST_ENDPOINT, (page - 1), limit)}
+            links['prev'] = {"href": link.format(host_url, endpoint, (page - 1), limit, query)}
+
+        if paginated_list.total is None:
+            return jsonify({"messages": messages, "_links": links})
+
+        last_page = max(1, -(-paginated_list.total // limit))
+        links['last'] = {"href": link.format(host_url, endpoint, last_page, limit, query)}
+
+        return jsonify({"messages": messages, "_links": links, "total": paginated_list.total})
+
+    @staticmethod
+    def _keyset_list_to_json(keyset_page, cursor, limit, host_url, user_urn, filters=None):
+        """used to change a keyset page to json format with opaque cursor links, links keep any list filters"""
+        messages = MessageList._messages_to_json(keyset_page.items, host_url, user_urn)
+        query = MessageList._filter_query(filters)
+        link = "{0}{1}?cursor={2}&limit={3}{4}"
+
+        links = {
+            'first': {"href": link.format(host_url, MESSAGE_LIST_ENDPOINT, '', limit, query)},
+            'self': {"href": link.format(host_url, MESSAGE_LIST_ENDPOINT, cursor, limit, query)}
+        }
+
+        if keyset_page.has_next and keyset_page.items:
+            next_cursor = MessageList._encode_cursor('next', keyset_page.items[-1])
+            links['next'] = {"href": link.format(host_url, MESSAGE_LIST_ENDPOINT, next_cursor, limit, query)}
+
+        if keyset_page.has_prev and keyset_page.items:
+            prev_cursor = MessageList._encode_cursor('prev', keyset_page.items[0])
+            links['prev'] = {"href": link.format(host_url, MESSAGE_LIST_ENDPOINT, prev_cursor, limit, query)}
 
         return jsonify({"messages": messages, "_links": links})
 
+    @staticmethod
+    def _encode_cursor(direction, message):
+        """used to build an opaque cursor pointing either side of a message"""
+        sent_date = message.sent_date.strftime(CURSOR_DATE_FORMAT) if message.sent_date is not None else ''
+        raw = "{0}|{1}|{2}".format(direction, sent_date, message.id)
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        """used to turn an opaque cursor into a (direction, sent_date, id) tuple, None for the first page"""
+        if not cursor:
+            return None
+        try:
+            direction, sent_date, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            sent_date = datetime.strptime(sent_date, CURSOR_DATE_FORMAT) if sent_date else None
+            row_id = int(row_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise BadRequest(description="Invalid cursor provided: {0}".format(cursor))
+        if direction not in ['next', 'prev']:
+            raise BadRequest(description="Invalid cursor provided: {0}".format(cursor))
+        return direction, sent_date, row_id
+
+
+class MessageSearch(Resource):
+    """Return the messages visible to the user matching a text search, best match first"""
+
+    @staticmethod
+    def get():
+        page = 1
+        limit = int(MESSAGE_QUERY_LIMIT)
+        user_urn = request.headers.get('user_urn')
+
+        query = request.args.get('q')
+        words = SearchIndex.words(query)
+        if not words:
+            raise BadRequest(description="Search query must contain at least one word")
+
+        if request.args.get('limit') and request.args.get('page'):
+            page = int(request.args.get('page'))
+            limit = int(request.args.get('limit'))
+
+        status, result = Retriever().search_messages(words, page, limit, user_urn)
+        if status:
+            resp = MessageList._paginated_list_to_json(result, page, limit, request.host_url, user_urn,
+                                                       MESSAGE_SEARCH_ENDPOINT, {'q': query})
+            resp.status_code = 200
+            return resp
+
+
+class MessageExport(Resource):
+    """Stream every message visible to the user as newline delimited json"""
+
+    @staticmethod
+    def get():
+        user_urn = request.headers.get('user_urn')
+        host_url = request.host_url
+
+        def generate():
+            for message in Retriever().retrieve_message_stream(user_urn):
+                msg = message.serialize(user_urn)
+                msg['_links'] = {"self": {"href": "{0}{1}/{2}".format(host_url, MESSAGE_BY_ID_ENDPOINT,
+                                                                      msg['msg_id'])}}
+                yield json.dumps(msg) + '\n'
+
+        return Response(stream_with_context(generate()), status=200, mimetype='application/x-ndjson')
+
+
+class MessageCount(Resource):
+    """Return the number of messages per label for the user"""
+
+    @staticmethod
+    def get():
+        user_urn = request.headers.get('user_urn')
+        if User(user_urn).is_respondent:
+            actor = user_urn
+        else:
+            actor = request.args.get('survey')
+            if not actor:
+                raise BadRequest(description="Survey required to count messages for an internal user")
+
+        counts = Retriever().retrieve_label_counts(actor)
+
+        label = request.args.get('label')
+        if label is not None:
+            if label not in Labels.label_list.value:
+                raise BadRequest(description="Invalid label provided: {0}".format(label))
+            counts = {label: counts.get(label, 0)}
+
+        resp = jsonify({'counts': counts})
+        resp.status_code = 200
+        return resp
+
 
 class MessageSend(Resource):
     """Send message for a user"""
@@ -113,39 +285,104 @@ class MessageSend(Resource):
             return True
 
     @staticmethod
-    def del_draft_labels(draft_id):
+    def del_draft_labels(draft_id, commit=True):
         modifier = Modifier()
-        modifier.del_draft(draft_id)
+        modifier.del_draft(draft_id, commit)
 
     def message_save(self, message, is_draft, draft_id):
         """Saves the message to the database along with the subsequent status and audit"""
         save = Saver()
-        save.save_message(message.data, datetime.now(timezone.utc))
-        if User(message.data.urn_from).is_respondent:
-            save.save_msg_status(message.data.urn_from, message.data.msg_id, Labels.SENT.value)
-            save.save_msg_status(message.data.survey, message.data.msg_id, Labels.INBOX.value)
-            save.save_msg_status(message.data.survey, message.data.msg_id, Labels.UNREAD.value)
-        else:
-            save.save_msg_status(message.data.survey, message.data.msg_id, Labels.SENT.value)
-            save.save_msg_audit(message.data.msg_id, message.data.urn_from)
-            save.save_msg_status(message.data.urn_to, message.data.msg_id, Labels.INBOX.value)
-            save.save_msg_status(message.data.urn_to, message.data.msg_id, Labels.UNREAD.value)
-
+        save.save_message(message.data, datetime.now(timezone.utc), commit=False)
+        statuses, audit_user = MessageSend.sent_statuses(message.data)
+        for actor, label in statuses:
+            save.save_msg_status(actor, message.data.msg_id, label, commit=False)
+        if audit_user is not None:
+            save.save_msg_audit(message.data.msg_id, audit_user, commit=False)
         if is_draft is True:
-            self.del_draft_labels(draft_id)
+            self.del_draft_labels(draft_id, commit=False)
+        save.commit(mailboxes=[actor for actor, _ in statuses])
+
         return MessageSend._alert_recipients(message.data.msg_id)
 
+    @staticmethod
+    def sent_statuses(message):
+        """returns the (actor, label) status rows for a sent message and the internal user to audit, if any"""
+        if User(message.urn_from).is_respondent:
+            return [(message.urn_from, Labels.SENT.value), (message.survey, Labels.INBOX.value),
+                    (message.survey, Labels.UNREAD.value)], None
+        return [(message.survey, Labels.SENT.value), (message.urn_to, Labels.INBOX.value),
+                (message.urn_to, Labels.UNREAD.value)], message.urn_from
+
     @staticmethod
     def _alert_recipients(reference):
         """used to alert user once messages have been saved"""
         recipient_email = settings.NOTIFICATION_DEV_EMAIL  # TODO change this when know more about party service
-        alert_user = AlertUser()
-        alert_status, alert_detail = alert_user.send(recipient_email, reference)
+        alert_status, alert_detail = alert_dispatcher.send(recipient_email, reference)
         resp = jsonify({'status': '{0}'.format(alert_detail), 'msg_id': reference})
         resp.status_code = alert_status
         return resp
 
 
+class MessageBulkSend(Resource):
+    """Send one message to many recipients"""
+
+    def post(self):
+        """used to handle POST requests sending a template message to a list of recipients"""
+        logger.info("Message bulk send POST request.")
+        post_data = request.get_json()
+        template, recipients = MessageBulkSend.validate_request(post_data)
+
+        messages = []
+        for recipient in recipients:
+            message = MessageSchema().load(dict(template, urn_to=recipient))
+            if message.errors != {}:
+                res = jsonify(message.errors)
+                res.status_code = 400
+                return res
+            messages.append(message.data)
+        return self.message_save_bulk(messages)
+
+    @staticmethod
+    def validate_request(post_data):
+        """Used to validate the template message and recipient list, returns them as (dict, list)"""
+        if post_data is None or 'message' not in post_data or not isinstance(post_data['message'], dict):
+            raise BadRequest(description="No message provided")
+        template = dict(post_data['message'])
+        for field in ['msg_id', 'urn_to']:
+            if field in template:
+                raise BadRequest(description="Message can not include {0}".format(field))
+
+        recipients = post_data.get('recipients')
+        if not recipients or not isinstance(recipients, list):
+            raise BadRequest(description="No recipients provided")
+        for recipient in recipients:
+            if not isinstance(recipient, str):
+                raise BadRequest(description="Invalid recipient provided: {0}".format(recipient))
+
+        return template, recipients
+
+    @staticmethod
+    def message_save_bulk(messages):
+        """Saves all messages with their statuses and audits in one bulk write, then queues an alert per recipient"""
+        statuses = []
+        audits = []
+        for message in messages:
+            labels, audit_user = MessageSend.sent_statuses(message)
+            statuses.extend((actor, message.msg_id, label) for actor, label in labels)
+            if audit_user is not None:
+                audits.append((message.msg_id, audit_user))
+
+        Saver().save_messages_bulk(messages, datetime.now(timezone.utc), statuses, audits)
+
+        for message in messages:
+            alert_dispatcher.send(settings.NOTIFICATION_DEV_EMAIL, message.msg_id)
+
+        resp = jsonify({'status': 'OK',
+                        'messages': [{'urn_to': message.urn_to, 'msg_id': message.msg_id} for message in messages]})
+        resp.status_code = 201
+        return resp
+
+
 class MessageById(Resource):
     """Get and update message by id"""
 
@@ -156,9 +393,15 @@ class MessageById(Resource):
         user_urn = request.headers.get('user_urn')  # getting user urn from header request
         # check user is authorised to view message
         message_service = Retriever()
+        survey = None if User(user_urn).is_respondent else message_service.retrieve_message_survey(message_id)
+        etag = mailbox_etag(message_service.retrieve_mailbox_version(user_urn, survey), user_urn, request.url)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
         # pass msg_id and user urn
-        resp = message_service.retrieve_message(message_id, user_urn)
-        return jsonify(resp)
+        resp = jsonify(message_service.retrieve_message(message_id, user_urn))
+        resp.set_etag(etag)
+        return resp
 
 
 class ModifyById(Resource):
@@ -192,14 +435,13 @@ class ModifyById(Resource):
 
     @staticmethod
     def modify_label(action, message, user_urn, label):
-        """Adds or deletes a label"""
-        label_exists = label in message
+        """Adds a label the message does not have or deletes one it has, returns False otherwise"""
+        label_exists = label in message['labels']
         if action == 'add' and not label_exists:
             return Modifier.add_label(label, message, user_urn)
-        if label_exists:
+        if action == 'remove' and label_exists:
             return Modifier.remove_label(label, message, user_urn)
-        else:
-            return False
+        return False
 
     @staticmethod
     def modify_unread(action, message, user_urn):
@@ -228,3 +470,66 @@ class ModifyById(Resource):
             raise BadRequest(description="Invalid action requested: {0}".format(action))
 
         return action, label
+
+
+class ModifyBatch(Resource):
+    """Update the status of many messages by id"""
+
+    @staticmethod
+    def put():
+        """Update messages by status, one set based change for all ids"""
+        user_urn = request.headers.get('user_urn')
+
+        request_data = request.get_json()
+        if not isinstance(request_data, dict):
+            raise BadRequest(description="Request body must be a JSON object")
+
+        action, label = ModifyById.validate_request(request_data)
+        msg_ids = ModifyBatch.validate_msg_ids(request_data)
+
+        messages = Retriever().retrieve_messages(msg_ids, user_urn)
+        results = {msg_id: 'not found' for msg_id in msg_ids if msg_id not in messages}
+
+        to_change = [message for message in messages.values() if ModifyBatch.needs_change(action, label, message)]
+        results.update({msg_id: 'unchanged' for msg_id in messages})
+        results.update({message['msg_id']: 'ok' for message in to_change})
+
+        if to_change:
+            ModifyBatch.modify(action, label, to_change, user_urn)
+
+        res = jsonify({'status': 'ok', 'messages': results})
+        res.status_code = 200
+        return res
+
+    @staticmethod
+    def validate_msg_ids(request_data):
+        """Used to validate the list of message ids within request body for ModifyBatch"""
+        msg_ids = request_data.get('msg_ids')
+        if not msg_ids or not isinstance(msg_ids, list):
+            raise BadRequest(description="No msg_ids provided")
+        if len(msg_ids) > constants.MAX_MODIFY_BATCH_SIZE:
+            raise BadRequest(description="Too many msg_ids provided, the maximum is {0}"
+                             .format(constants.MAX_MODIFY_BATCH_SIZE))
+        for msg_id in msg_ids:
+            if not isinstance(msg_id, str) or len(msg_id) > constants.MAX_MSG_ID_LEN:
+                raise BadRequest(description="Invalid msg_id provided: {0}".format(msg_id))
+        return msg_ids
+
+    @staticmethod
+    def needs_change(action, label, message):
+        """returns True if applying the action would change the message labels"""
+        labels = message['labels']
+        if label == Labels.UNREAD.value and action == 'add':
+            return Labels.INBOX.value in labels and label not in labels
+        if label == Labels.UNREAD.value:
+            return Labels.INBOX.value in labels and label in labels and message['read_date'] is None
+        return (label not in labels) if action == 'add' else (label in labels)
+
+    @staticmethod
+    def modify(action, label, messages, user_urn):
+        """Apply the label change to all messages"""
+        if label == Labels.UNREAD.value and action == 'remove':
+            return Modifier.del_unread_many(messages, user_urn)
+        if action == 'add':
+            return Modifier.add_label_many(label, messages, user_urn)
+        return Modifier.remove_label_many(label, messages, user_urn)
@@ -0,0 +1,48 @@
+from flask_restful import Resource
+from flask import request, jsonify
+from app.repository.retriever import Retriever
+from app.resources.messages import MessageList
+from app.settings import MESSAGE_QUERY_LIMIT
+import logging
+
+logger = logging.getLogger(__name__)
+
+THREAD_LIST_ENDPOINT = "threads"
+THREAD_BY_ID_ENDPOINT = "thread"
+
+"""Rest endpoint for threads, a thread is every message sharing a thread_id"""
+
+
+class ThreadById(Resource):
+    """Return the messages in a thread, oldest first"""
+
+    @staticmethod
+    def get(thread_id):
+        user_urn = request.headers.get('user_urn')
+        messages = Retriever().retrieve_thread(thread_id, user_urn)
+        links = {'self': {"href": "{0}{1}/{2}".format(request.host_url, THREAD_BY_ID_ENDPOINT, thread_id)}}
+        resp = jsonify({"messages": MessageList._messages_to_json(messages, request.host_url, user_urn),
+                        "_links": links})
+        resp.status_code = 200
+        return resp
+
+
+class ThreadList(Resource):
+    """Return the latest message of each thread for the user, newest first"""
+
+    @staticmethod
+    def get():
+        page = 1
+        limit = int(MESSAGE_QUERY_LIMIT)
+        user_urn = request.headers.get('user_urn')
+
+        if request.args.get('limit') and request.args.get('page'):
+            page = int(request.args.get('page'))
+            limit = int(request.args.get('limit'))
+
+        status, result = Retriever().retrieve_thread_list(page, limit, user_urn)
+        if status:
+            resp = MessageList._paginated_list_to_json(result, page, limit, request.host_url, user_urn,
+                                                       THREAD_LIST_ENDPOINT)
+            resp.status_code = 200
+            return resp
@@ -22,19 +22,67 @@ NOTIFICATION_COMBINED_KEY = 'key-name-{}-{}'.format(NOTIFICATION_SERVICE_ID, NOT
 NOTIFICATION_TEMPLATE_ID = 'a1995c3d-68ce-42be-bddf-287b0870544b'
 NOTIFICATION_DEV_EMAIL = os.getenv('NOTIFICATION_DEV_EMAIL', 'gemma.irving@ons.gov.uk')
 
+# Background alert dispatch, 0 workers sends alerts on the request thread. Alerts still queued at exit
+# are given NOTIFICATION_SHUTDOWN_TIMEOUT seconds to send
+NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', 2))
+NOTIFICATION_SHUTDOWN_TIMEOUT = float(os.getenv('NOTIFICATION_SHUTDOWN_TIMEOUT', 5))
+NOTIFICATION_MAX_RETRIES = int(os.getenv('NOTIFICATION_MAX_RETRIES', 3))
+NOTIFICATION_RETRY_DELAY = float(os.getenv('NOTIFICATION_RETRY_DELAY', 0.5))
+
 
 MESSAGE_QUERY_LIMIT = os.getenv('MESSAGE_QUERY_LIMIT', 15)
 
+# Message list totals: 'none' pages without counting, 'approximate' adds a total cached per user for
+# MESSAGE_LIST_TOTAL_TTL seconds and 'exact' counts on every request
+MESSAGE_LIST_TOTAL = os.getenv('MESSAGE_LIST_TOTAL', 'none')
+MESSAGE_LIST_TOTAL_TTL = float(os.getenv('MESSAGE_LIST_TOTAL_TTL', 60))
+MESSAGE_LIST_TOTAL_CACHE_SIZE = int(os.getenv('MESSAGE_LIST_TOTAL_CACHE_SIZE', 1024))
+
+# Cache of the fields of a message that never change, a size of 0 disables it
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', 1024))
+
+# Rows read from the database at a time when exporting a mailbox
+MESSAGE_EXPORT_BATCH_SIZE = int(os.getenv('MESSAGE_EXPORT_BATCH_SIZE', 500))
+
 # SQLAlchemy configuration
 
-SQLALCHEMY_POOL_SIZE = os.getenv('SQLALCHEMY_POOL_SIZE', None)
+
+def _optional_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# Connection pool, unset sizes keep SQLAlchemy's defaults. A 'null' pool class opens a connection per checkout,
+# for forked workers or an external pooler. Pre-ping tests pooled connections on checkout, replacing any left
+# stale by a database restart or failover, and connections older than SQLALCHEMY_POOL_RECYCLE seconds are reopened
+SQLALCHEMY_POOL_CLASS = os.getenv('SQLALCHEMY_POOL_CLASS', 'queue')
+SQLALCHEMY_POOL_SIZE = _optional_int('SQLALCHEMY_POOL_SIZE')
+SQLALCHEMY_MAX_OVERFLOW = _optional_int('SQLALCHEMY_MAX_OVERFLOW')
+SQLALCHEMY_POOL_TIMEOUT = _optional_int('SQLALCHEMY_POOL_TIMEOUT')
+SQLALCHEMY_POOL_RECYCLE = _optional_int('SQLALCHEMY_POOL_RECYCLE')
+SQLALCHEMY_POOL_PRE_PING = os.getenv('SQLALCHEMY_POOL_PRE_PING', 'false').lower() == 'true'
+
+# Per request SQL instrumentation: query count and database time in response headers and the log.
+# Statements taking at least SQL_SLOW_QUERY_MS are logged, 0 turns slow query logging off
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'false').lower() == 'true'
+SQL_SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', 500))
 
 
 JWT_SECRET = os.getenv('JWT_SECRET', 'vrwgLNWEffe45thh545yuby')
 
-#  Keys
-SM_USER_AUTHENTICATION_PRIVATE_KEY = open("{0}/jwt-test-keys/sm-user-authentication-encryption-private-key.pem".format(os.getenv('RAS_SM_PATH'))).read()
-SM_USER_AUTHENTICATION_PUBLIC_KEY = open("{0}/jwt-test-keys/sm-user-authentication-encryption-public-key.pem".format(os.getenv('RAS_SM_PATH'))).read()
+# Token decryption on a process pool, 0 processes decrypts on the request thread
+TOKEN_DECRYPT_PROCESSES = int(os.getenv('TOKEN_DECRYPT_PROCESSES', 0))
+TOKEN_DECRYPT_TIMEOUT = float(os.getenv('TOKEN_DECRYPT_TIMEOUT', 5))
+
+# Validated token cache, a size of 0 disables caching
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 1024))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 300))
+
+#  Keys, read again from their files by app.authentication.jwe.reload_keys after rotation
+SM_USER_AUTHENTICATION_PRIVATE_KEY_PATH = "{0}/jwt-test-keys/sm-user-authentication-encryption-private-key.pem".format(os.getenv('RAS_SM_PATH'))
+SM_USER_AUTHENTICATION_PUBLIC_KEY_PATH = "{0}/jwt-test-keys/sm-user-authentication-encryption-public-key.pem".format(os.getenv('RAS_SM_PATH'))
+SM_USER_AUTHENTICATION_PRIVATE_KEY = open(SM_USER_AUTHENTICATION_PRIVATE_KEY_PATH).read()
+SM_USER_AUTHENTICATION_PUBLIC_KEY = open(SM_USER_AUTHENTICATION_PUBLIC_KEY_PATH).read()
 
 #  password
 SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD = "digitaleq"
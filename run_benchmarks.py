@@ -0,0 +1,13 @@
+import sys
+
+if __name__ == "__main__":
+    sys.path.insert(0, './tests/benchmark')
+    names = sys.argv[1:] or ['jwe', 'api']
+    passed = True
+    if 'jwe' in names:
+        import jwe_benchmark
+        jwe_benchmark.run()
+    if 'api' in names:
+        import api_benchmark
+        passed = api_benchmark.run()
+    sys.exit(0 if passed else 1)
@@ -1,8 +1,9 @@
+import threading
 import unittest
 from unittest.mock import Mock
 from unittest.mock import patch
 from app import settings
-from app.common.alerts import AlertUser, AlertViaGovNotify
+from app.common.alerts import AlertDispatcher, AlertUser, AlertViaGovNotify, AlertViaLogging
 from notifications_python_client import errors
 
 
@@ -43,6 +44,79 @@ class AlertsTestCase(unittest.TestCase):
         resp = sut.send("MyEmail", "MyRef")
         self.assertTrue(resp[0] == 201)
 
+    def test_dispatcher_sends_queued_alerts_in_background(self):
+        """test alerts queued on the dispatcher are delivered by the worker threads"""
+        alerter = AlertViaLogging()
+        sut = AlertDispatcher(alerter, workers=2, max_retries=0, retry_delay=0)
+        for reference in range(12):
+            self.assertEqual(sut.send("MyEmail", reference), (201, 'OK'))
+        sut.join()
+        self.assertCountEqual([reference for email, reference in alerter.sent], range(12))
+        self.assertEqual(sut.sent_count, 12)
+        self.assertEqual(sut.queue_depth, 0)
+
+    def test_dispatcher_retries_before_counting_failure(self):
+        """test an alert that keeps failing is retried then counted as failed"""
+        alerter = Mock(AlertViaGovNotify)
+        alerter.send.side_effect = errors.HTTPError()
+        sut = AlertDispatcher(alerter, workers=1, max_retries=2, retry_delay=0)
+        sut.send("MyEmail", "MyRef")
+        sut.join()
+        self.assertEqual(alerter.send.call_count, 3)
+        self.assertEqual(sut.failed_count, 1)
+        self.assertEqual(sut.sent_count, 0)
+
+    def test_drain_waits_for_queued_alerts(self):
+        """test draining at shutdown lets queued alerts finish sending"""
+        alerter = AlertViaLogging()
+        sut = AlertDispatcher(alerter, workers=1, max_retries=0, retry_delay=0)
+        for reference in range(3):
+            sut.send("MyEmail", reference)
+        self.assertEqual(sut.drain(timeout=5), 0)
+        self.assertEqual(sut.sent_count, 3)
+
+    def test_drain_logs_alerts_left_unsent(self):
+        """test alerts still queued when the drain times out are logged rather than lost silently"""
+        release = threading.Event()
+        alerter = Mock(AlertViaGovNotify)
+        alerter.send.side_effect = lambda email, reference: release.wait(5)
+        sut = AlertDispatcher(alerter, workers=1, max_retries=0, retry_delay=0)
+        for reference in range(3):
+            sut.send("MyEmail", reference)
+        try:
+            with self.assertLogs('app.common.alerts', level='ERROR') as logs:
+                self.assertEqual(sut.drain(timeout=0.05), 3)
+            self.assertIn('3 queued alerts were not sent before shutdown', logs.output[0])
+        finally:
+            release.set()
+            sut.join()
+
+    def test_dispatcher_recovers_when_retry_succeeds(self):
+        """test an alert failing once is delivered on retry"""
+        alerter = Mock(AlertViaGovNotify)
+        alerter.send.side_effect = [Exception('Oh Dear'), None]
+        sut = AlertDispatcher(alerter, workers=0, max_retries=1, retry_delay=0)
+        sut.send("MyEmail", "MyRef")
+        self.assertEqual(sut.sent_count, 1)
+        self.assertEqual(sut.failed_count, 0)
+
+    def test_dispatcher_without_alerter_uses_alert_user_default(self):
+        """test the dispatcher follows AlertUser.alert_method when no alerter is given"""
+        sut = AlertDispatcher()
+        self.assertTrue(sut.alert_method is AlertUser.alert_method)
+
+    @patch('app.common.alerts.NotificationsAPIClient')
+    def test_gov_notify_client_is_reused(self, mock_client):
+        """test the notifications client is only constructed once across sends"""
+        AlertViaGovNotify._client = None
+        try:
+            AlertViaGovNotify.send("MyEmail", "MyRef")
+            AlertViaGovNotify.send("MyEmail", "MyRef")
+            self.assertEqual(mock_client.call_count, 1)
+            self.assertEqual(mock_client.return_value.send_email_notification.call_count, 2)
+        finally:
+            AlertViaGovNotify._client = None
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,8 +3,8 @@ from datetime import datetime, timezone
 from unittest import mock
 from flask import current_app
 from flask import json
-from sqlalchemy import create_engine
-from app import application
+from sqlalchemy import create_engine, text
+from app import application, constants
 from app import settings
 from app.application import app
 from app.common.alerts import AlertUser, AlertViaGovNotify
@@ -277,6 +277,33 @@ class FlaskTestCase(unittest.TestCase):
         self.assertTrue(msg_id is not None)
         self.assertEqual(response.status_code, 201)
 
+    def send_saved_draft(self):
+        """saves a draft then sends it, returning the draft id and the send response"""
+        headers = {'Content-Type': 'application/json', 'user_urn': ''}
+        draft = self.app.post("http://localhost:5050/draft/save", data=json.dumps(self.test_message), headers=headers)
+        draft_id = json.loads(draft.data)['msg_id']
+        response = self.app.post("http://localhost:5050/message/send", headers=headers,
+                                 data=json.dumps(dict(self.test_message, msg_id=draft_id)))
+        return draft_id, response
+
+    def test_sending_draft_replaces_it_with_sent_message(self):
+        """Check sending a draft removes the draft and its statuses along with saving the message"""
+        draft_id, response = self.send_saved_draft()
+        self.assertEqual(response.status_code, 201)
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM status WHERE msg_id = '{0}'".format(draft_id)).scalar(), 0)
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM secure_message").scalar(), 1)
+
+    def test_failed_draft_cleanup_saves_nothing(self):
+        """Check the sent message is rolled back with the draft cleanup when removing the draft fails"""
+        with mock.patch('app.repository.modifier.DELETE_DRAFT_MESSAGE',
+                        text("DELETE FROM no_such_table WHERE msg_id = :b_msg_id")):
+            draft_id, response = self.send_saved_draft()
+        self.assertEqual(response.status_code, 500)
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute("SELECT msg_id FROM secure_message").fetchall(), [(draft_id,)])
+            self.assertEqual({row[0] for row in con.execute("SELECT label FROM status")}, {'DRAFT'})
+
     def test_draft_with_msg_id_post_returns_400(self):
         """Check draft saved with message id fails"""
         url = "http://localhost:5050/draft/save"
@@ -293,6 +320,388 @@ class FlaskTestCase(unittest.TestCase):
         response = self.app.post(url, data=json.dumps(data), headers=headers)
         self.assertEqual(response.status_code, 400)
 
+    def test_get_messages_with_cursor_follows_next_link(self):
+        """Check cursor mode message list returns sent messages and a working next link"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        self.test_message['urn_from'] = 'respondent.21345'
+        for _ in range(3):
+            self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message), headers=headers)
+
+        response = self.app.get("http://localhost:5050/messages?cursor=&limit=2", headers=headers)
+        data = json.loads(response.get_data())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['messages']), 2)
+
+        response = self.app.get(data['_links']['next']['href'], headers=headers)
+        data = json.loads(response.get_data())
+        self.assertEqual(len(data['messages']), 1)
+        self.assertFalse('next' in data['_links'])
+        self.assertTrue('prev' in data['_links'])
+
+    def test_export_streams_one_json_message_per_line(self):
+        """Check export returns every message visible to the user as newline delimited json"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        self.test_message['urn_from'] = 'respondent.21345'
+        for _ in range(3):
+            self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message), headers=headers)
+
+        response = self.app.get("http://localhost:5050/messages/export", headers=headers)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), 3)
+        for line in lines:
+            message = json.loads(line)
+            self.assertEqual(message['labels'], ['SENT'])
+            self.assertTrue(message['_links']['self']['href'].endswith(message['msg_id']))
+
+    def test_get_thread_returns_reply_after_original(self):
+        """Check a thread holds the original message and its reply in order"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        self.test_message['urn_from'] = 'respondent.21345'
+        response = self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message),
+                                 headers=headers)
+        original = json.loads(response.data)
+        self.test_message['thread_id'] = original['msg_id']
+        self.test_message['body'] = 'reply'
+        self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message), headers=headers)
+
+        response = self.app.get("http://localhost:5050/thread/{0}".format(original['msg_id']), headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['messages']['1']['msg_id'], original['msg_id'])
+        self.assertEqual(data['messages']['2']['body'], 'reply')
+
+    def test_get_threads_returns_latest_message_of_each_thread(self):
+        """Check the thread list returns one message per thread"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        self.test_message['urn_from'] = 'respondent.21345'
+        response = self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message),
+                                 headers=headers)
+        self.test_message['thread_id'] = json.loads(response.data)['msg_id']
+        self.test_message['body'] = 'reply'
+        self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message), headers=headers)
+        self.test_message['thread_id'] = ''
+        self.app.post("http://localhost:5050/message/send", data=json.dumps(self.test_message), headers=headers)
+
+        response = self.app.get("http://localhost:5050/threads", headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['messages']), 2)
+        self.assertEqual(data['_links']['self']['href'], "http://localhost:5050/threads?page=1&limit=15")
+
+    def test_get_messages_filtered_by_label(self):
+        """Check the message list only returns messages with the label asked for"""
+        msg_ids = self.send_messages_to_respondent(3)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        data = {'msg_ids': msg_ids[:1], 'action': 'add', 'label': 'ARCHIVE'}
+        self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+
+        response = self.app.get("http://localhost:5050/messages?label=ARCHIVE", headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['msg_id'] for message in data['messages'].values()], msg_ids[:1])
+
+        response = self.app.get("http://localhost:5050/messages?cursor=&label=INBOX", headers=headers)
+        self.assertEqual(len(json.loads(response.data)['messages']), 3)
+
+    def test_get_messages_with_invalid_label_returns_400(self):
+        """Check the message list rejects an unknown label filter"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        response = self.app.get("http://localhost:5050/messages?label=NOPE", headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_returns_matching_messages_with_query_in_links(self):
+        """Check search finds sent messages by their body and keeps the query in page links"""
+        self.send_messages_to_respondent(2)
+        self.test_message['body'] = 'Your annual return is overdue'
+        msg_id = self.send_messages_to_respondent(1)[0]
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+
+        response = self.app.get("http://localhost:5050/messages/search?q=Annual+return", headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['msg_id'] for message in data['messages'].values()], [msg_id])
+        self.assertEqual(data['_links']['self']['href'],
+                         "http://localhost:5050/messages/search?page=1&limit=15&q=Annual+return")
+
+    def test_search_without_fts5_returns_503_and_messages_still_send(self):
+        """Check a database without FTS5 still saves messages and reports search as unavailable"""
+        with mock.patch('app.repository.database.sqlite_has_fts5', return_value=False):
+            with app.app_context():
+                database.db.drop_all()
+                database.db.create_all()
+        self.assertEqual(len(self.send_messages_to_respondent(1)), 1)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+
+        response = self.app.get("http://localhost:5050/messages/search?q=hello", headers=headers)
+        self.assertEqual(response.status_code, 503)
+
+    def test_search_without_words_returns_400(self):
+        """Check search rejects a query with nothing to search for"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        response = self.app.get("http://localhost:5050/messages/search?q=%22*", headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_messages_with_invalid_cursor_returns_400(self):
+        """Check cursor mode message list rejects a cursor it did not issue"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        response = self.app.get("http://localhost:5050/messages?cursor=abc", headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_send_returns_201_and_msg_id_per_recipient(self):
+        """Check bulk send returns a distinct msg_id for every recipient"""
+        url = "http://localhost:5050/message/send/bulk"
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        del self.test_message['urn_to']
+        self.test_message['urn_from'] = 'internal.21345'
+        recipients = ['respondent.1', 'respondent.2', 'respondent.3']
+
+        response = self.app.post(url, data=json.dumps({'message': self.test_message, 'recipients': recipients}),
+                                 headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([sent['urn_to'] for sent in data['messages']], recipients)
+        self.assertEqual(len(set(sent['msg_id'] for sent in data['messages'])), 3)
+
+    def test_bulk_send_stores_messages_statuses_and_audits(self):
+        """Check bulk send from an internal user writes each message with inbox, unread, sent and audit rows"""
+        url = "http://localhost:5050/message/send/bulk"
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        del self.test_message['urn_to']
+        self.test_message['urn_from'] = 'internal.21345'
+
+        response = self.app.post(url, data=json.dumps({'message': self.test_message,
+                                                       'recipients': ['respondent.1', 'respondent.2']}),
+                                 headers=headers)
+        msg_id = json.loads(response.data)['messages'][1]['msg_id']
+
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM secure_message').scalar(), 2)
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM internal_sent_audit').scalar(), 2)
+            labels = con.execute("SELECT actor, label FROM status WHERE msg_id='{0}'".format(msg_id)).fetchall()
+            self.assertCountEqual([tuple(row) for row in labels], [('test-123', 'SENT'), ('respondent.2', 'INBOX'),
+                                                                   ('respondent.2', 'UNREAD')])
+
+    def test_bulk_send_without_recipients_returns_400(self):
+        """Check bulk send rejects a request with no recipients"""
+        url = "http://localhost:5050/message/send/bulk"
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        del self.test_message['urn_to']
+        response = self.app.post(url, data=json.dumps({'message': self.test_message, 'recipients': []}),
+                                 headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_send_with_invalid_message_returns_400(self):
+        """Check bulk send validates the template message and rejects it"""
+        url = "http://localhost:5050/message/send/bulk"
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        del self.test_message['urn_to']
+        self.test_message['body'] = ''
+        response = self.app.post(url, data=json.dumps({'message': self.test_message, 'recipients': ['respondent.1']}),
+                                 headers=headers)
+        self.assertEqual(response.status_code, 400)
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM secure_message').scalar(), 0)
+
+    def test_bulk_send_with_invalid_recipient_returns_400(self):
+        """Check bulk send validates every recipient, not just the first, and saves nothing if one is invalid"""
+        url = "http://localhost:5050/message/send/bulk"
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        del self.test_message['urn_to']
+        recipients = ['respondent.1', '', 'respondent.3']
+        response = self.app.post(url, data=json.dumps({'message': self.test_message, 'recipients': recipients}),
+                                 headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('urn_to', json.loads(response.data))
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM secure_message').scalar(), 0)
+
+    def send_messages_to_respondent(self, count):
+        """sends count messages from an internal user to respondent.21345 and returns their msg_ids"""
+        url = "http://localhost:5050/message/send"
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        self.test_message.update({'urn_to': 'respondent.21345', 'urn_from': 'internal.21345'})
+        msg_ids = []
+        for _ in range(count):
+            response = self.app.post(url, data=json.dumps(self.test_message), headers=headers)
+            msg_ids.append(json.loads(response.data)['msg_id'])
+        return msg_ids
+
+    def test_batch_modify_archives_every_message(self):
+        """Check batch modify adds the archive label to each message and reports per id results"""
+        msg_ids = self.send_messages_to_respondent(3)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        data = {'msg_ids': msg_ids + ['missing'], 'action': 'add', 'label': 'ARCHIVE'}
+
+        response = self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+        results = json.loads(response.data)['messages']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results['missing'], 'not found')
+        for msg_id in msg_ids:
+            self.assertEqual(results[msg_id], 'ok')
+
+        with self.engine.connect() as con:
+            count = con.execute("SELECT COUNT(*) FROM status WHERE label='ARCHIVE' AND actor='respondent.21345'")
+            self.assertEqual(count.scalar(), 3)
+
+    def test_batch_modify_marks_every_message_read(self):
+        """Check batch modify removes unread and sets read date, leaving already read messages unchanged"""
+        msg_ids = self.send_messages_to_respondent(3)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        data = {'msg_ids': msg_ids[:1], 'action': 'remove', 'label': 'UNREAD'}
+        self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+
+        data = {'msg_ids': msg_ids, 'action': 'remove', 'label': 'UNREAD'}
+        response = self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+        results = json.loads(response.data)['messages']
+        self.assertEqual(results[msg_ids[0]], 'unchanged')
+        self.assertEqual(results[msg_ids[1]], 'ok')
+
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM status WHERE label='UNREAD'").scalar(), 0)
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM secure_message WHERE read_date IS NULL").scalar(), 0)
+
+    def test_count_returns_unread_count_for_respondent(self):
+        """Check message count reflects sent messages and messages marked read"""
+        msg_ids = self.send_messages_to_respondent(3)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        data = {'msg_ids': msg_ids[:1], 'action': 'remove', 'label': 'UNREAD'}
+        self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+
+        response = self.app.get("http://localhost:5050/messages/count", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['counts'], {'INBOX': 3, 'UNREAD': 2})
+
+        response = self.app.get("http://localhost:5050/messages/count?label=ARCHIVE", headers=headers)
+        self.assertEqual(json.loads(response.data)['counts'], {'ARCHIVE': 0})
+
+    def test_count_for_internal_user_uses_survey(self):
+        """Check an internal user counts messages for the survey given"""
+        self.send_messages_to_respondent(2)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+
+        response = self.app.get("http://localhost:5050/messages/count?survey=test-123&label=SENT", headers=headers)
+        self.assertEqual(json.loads(response.data)['counts'], {'SENT': 2})
+
+        response = self.app.get("http://localhost:5050/messages/count", headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_count_with_invalid_label_returns_400(self):
+        """Check message count rejects an unknown label"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        response = self.app.get("http://localhost:5050/messages/count?label=NOPE", headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_messages_returns_304_when_mailbox_unchanged(self):
+        """Check a repeated list request with the etag returns 304 without querying messages"""
+        self.send_messages_to_respondent(2)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        response = self.app.get("http://localhost:5050/messages", headers=headers)
+        etag = response.headers['ETag']
+
+        with mock.patch('app.resources.messages.Retriever.retrieve_message_list') as retrieve:
+            response = self.app.get("http://localhost:5050/messages", headers=dict(headers, **{'If-None-Match': etag}))
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+            self.assertFalse(retrieve.called)
+
+        response = self.app.get("http://localhost:5050/messages?page=1&limit=1",
+                                headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_messages_etag_changes_after_modify(self):
+        """Check a label change gives the mailbox a new etag"""
+        msg_ids = self.send_messages_to_respondent(1)
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        etag = self.app.get("http://localhost:5050/messages", headers=headers).headers['ETag']
+
+        data = {'action': 'add', 'label': 'ARCHIVE'}
+        self.app.put("http://localhost:5050/message/{0}/modify".format(msg_ids[0]), data=json.dumps(data),
+                     headers=headers)
+
+        response = self.app.get("http://localhost:5050/messages", headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_message_etag_changes_when_other_party_reads_it(self):
+        """Check a message's etag changes for the sender when the recipient marks it read"""
+        msg_id = self.send_messages_to_respondent(1)[0]
+        internal = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        respondent = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        url = "http://localhost:5050/message/{0}".format(msg_id)
+        etag = self.app.get(url, headers=internal).headers['ETag']
+        self.assertEqual(self.app.get(url, headers=dict(internal, **{'If-None-Match': etag})).status_code, 304)
+
+        data = {'action': 'remove', 'label': 'UNREAD'}
+        self.app.put("{0}/modify".format(url), data=json.dumps(data), headers=respondent)
+
+        response = self.app.get(url, headers=dict(internal, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['read_date'] is not None)
+
+    def test_internal_etags_follow_only_their_survey(self):
+        """Check a message sent in another survey leaves an internal user's survey list and message etags alone
+        but changes the unfiltered list's"""
+        msg_id = self.send_messages_to_respondent(1)[0]
+        internal = {'Content-Type': 'application/json', 'user_urn': 'internal.21345'}
+        urls = ["http://localhost:5050/messages?survey=test-123", "http://localhost:5050/message/{0}".format(msg_id),
+                "http://localhost:5050/messages"]
+        etags = [self.app.get(url, headers=internal).headers['ETag'] for url in urls]
+
+        self.test_message['survey'] = 'other-456'
+        self.send_messages_to_respondent(1)
+
+        statuses = [self.app.get(url, headers=dict(internal, **{'If-None-Match': etag})).status_code
+                    for url, etag in zip(urls, etags)]
+        self.assertEqual(statuses, [304, 304, 200])
+
+    def test_modify_adds_and_removes_a_label_once(self):
+        """Check a label can be added and removed again, and that repeating either is rejected"""
+        msg_id = self.send_messages_to_respondent(1)[0]
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        url = "http://localhost:5050/message/{0}".format(msg_id)
+        statuses = []
+        for action in ['add', 'add', 'remove', 'remove']:
+            response = self.app.put("{0}/modify".format(url), data=json.dumps({'action': action, 'label': 'ARCHIVE'}),
+                                    headers=headers)
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 400, 200, 400])
+        self.assertNotIn('ARCHIVE', json.loads(self.app.get(url, headers=headers).data)['labels'])
+
+    def test_batch_modify_without_msg_ids_returns_400(self):
+        """Check batch modify rejects a request with no message ids"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        data = {'msg_ids': [], 'action': 'add', 'label': 'ARCHIVE'}
+        response = self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_modify_with_invalid_label_returns_400(self):
+        """Check batch modify validates the label as a single modify would"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        data = {'msg_ids': ['AMsgId'], 'action': 'add', 'label': 'SENT'}
+        response = self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_batch_modify_with_too_many_msg_ids_returns_400(self):
+        """Check batch modify rejects more message ids than one batch may hold"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        msg_ids = [str(i) for i in range(constants.MAX_MODIFY_BATCH_SIZE + 1)]
+        data = {'msg_ids': msg_ids, 'action': 'add', 'label': 'ARCHIVE'}
+        response = self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+        data['msg_ids'] = msg_ids[:-1]
+        response = self.app.put("http://localhost:5050/messages/modify", data=json.dumps(data), headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_modify_with_null_body_returns_400(self):
+        """Check batch modify rejects a body that is not a JSON object"""
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        for body in ['null', '[]']:
+            response = self.app.put("http://localhost:5050/messages/modify", data=body, headers=headers)
+            self.assertEqual(response.status_code, 400)
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,18 @@
-from app.authentication.authenticator import check_jwt
+from app.authentication.authenticator import check_jwt, token_cache, TokenCache
 from app.authentication.jwt import encode
-from app.authentication.jwe import Encrypter
-from werkzeug.exceptions import BadRequest
+from app.authentication import jwe
+from app.authentication.jwe import Decrypter, DecryptPool, Encrypter
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
 from flask import Response
+from concurrent.futures.process import BrokenProcessPool
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 from app import settings
 
 
@@ -153,3 +162,168 @@ class AuthenticationTestCase(unittest.TestCase):
         with self.assertRaises(BadRequest):
             res = check_jwt(encode(data))
 
+    def test_keys_loaded_once_and_shared(self):
+        """Decrypter and Encrypter built from the same PEMs share the parsed key objects"""
+        decrypter = Decrypter()
+        encrypter = Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                              _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                              _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+        self.assertTrue(Decrypter().private_key is decrypter.private_key)
+        self.assertTrue(encrypter.private_key is decrypter.private_key)
+        self.assertTrue(encrypter.public_key is decrypter.public_key)
+
+    def test_reload_keys_parses_keys_again(self):
+        """reload_keys discards cached keys so rotated PEMs are picked up"""
+        decrypter = Decrypter()
+        jwe.reload_keys()
+        self.assertFalse(Decrypter().private_key is decrypter.private_key)
+
+    @staticmethod
+    def write_rotated_keys(directory):
+        """writes a new key pair protected by the configured password, returns the private and public key paths"""
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        pems = [key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.BestAvailableEncryption(
+                                      settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD.encode())),
+                key.public_key().public_bytes(serialization.Encoding.PEM,
+                                              serialization.PublicFormat.SubjectPublicKeyInfo)]
+        paths = [os.path.join(directory, name) for name in ('private.pem', 'public.pem')]
+        for path, pem in zip(paths, pems):
+            with open(path, 'wb') as pem_file:
+                pem_file.write(pem)
+        return paths
+
+    def test_reload_keys_reads_rotated_key_files(self):
+        """reload_keys reads the key files again, so tokens encrypted for rotated keys are decrypted"""
+        with tempfile.TemporaryDirectory() as directory:
+            private_path, public_path = self.write_rotated_keys(directory)
+            try:
+                with mock.patch.multiple(settings, SM_USER_AUTHENTICATION_PRIVATE_KEY_PATH=private_path,
+                                         SM_USER_AUTHENTICATION_PUBLIC_KEY_PATH=public_path):
+                    jwe.reload_keys()
+                with open(public_path) as public_key_file:
+                    self.assertEqual(settings.SM_USER_AUTHENTICATION_PUBLIC_KEY, public_key_file.read())
+                with open(private_path) as private_key_file:
+                    encrypter = Encrypter(_private_key=private_key_file.read(),
+                                          _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                                          _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+                token = encode({"RU": "12345678910", "survey": "BRS", "CC": "URN"})
+                self.assertEqual(Decrypter().decrypt_token(encrypter.encrypt_token(token)).decode(), token)
+            finally:
+                jwe.reload_keys()
+
+    def test_authentication_jwt_pass_after_reload(self):
+        """Authenticate request using correct JWT after keys are reloaded"""
+        encrypter = Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                              _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                              _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+        encrypted_jwt = encrypter.encrypt_token(encode({"RU": "12345678910", "survey": "BRS", "CC": "URN"}))
+        jwe.reload_keys()
+        self.assertEqual(check_jwt(encrypted_jwt), {'status': "ok"})
+
+    def test_repeated_token_skips_decrypt(self):
+        """Authenticating the same token twice decrypts it once and counts a cache hit"""
+        encrypter = Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                              _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                              _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+        encrypted_jwt = encrypter.encrypt_token(encode({"RU": "12345678910", "survey": "BRS", "CC": "URN"}))
+        hits = token_cache.hits
+        self.assertEqual(check_jwt(encrypted_jwt), {'status': "ok"})
+        with mock.patch.object(Decrypter, 'decrypt_token') as decrypt_token:
+            self.assertEqual(check_jwt(encrypted_jwt), {'status': "ok"})
+            decrypt_token.assert_not_called()
+        self.assertEqual(token_cache.hits, hits + 1)
+
+    def test_invalid_claims_are_not_cached(self):
+        """A token failing claim checks is rejected every time it is presented"""
+        encrypter = Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                              _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                              _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+        encrypted_jwt = encrypter.encrypt_token(encode({"RU": "123", "survey": "BRS", "CC": "URN"}))
+        self.assertEqual(check_jwt(encrypted_jwt).status_code, 400)
+        self.assertTrue(token_cache.get(encrypted_jwt) is None)
+        self.assertEqual(check_jwt(encrypted_jwt).status_code, 400)
+
+    def test_token_cache_respects_exp_claim(self):
+        """Cached claims are not returned once the token exp has passed"""
+        cache = TokenCache(max_size=10, ttl=300)
+        cache.put('token', {'exp': time.time() - 1})
+        self.assertTrue(cache.get('token') is None)
+        self.assertEqual(cache.misses, 1)
+
+    def test_token_cache_respects_ttl(self):
+        """Cached claims are not returned once the cache ttl has passed"""
+        cache = TokenCache(max_size=10, ttl=0)
+        cache.put('token', {'RU': '12345678910'})
+        self.assertTrue(cache.get('token') is None)
+
+    def test_token_cache_evicts_least_recently_used(self):
+        """The least recently used token is evicted when the cache is full"""
+        cache = TokenCache(max_size=2, ttl=300)
+        cache.put('first', {'RU': '1'})
+        cache.put('second', {'RU': '2'})
+        cache.get('first')
+        cache.put('third', {'RU': '3'})
+        self.assertEqual(cache.get('first'), {'RU': '1'})
+        self.assertTrue(cache.get('second') is None)
+        self.assertEqual(cache.get('third'), {'RU': '3'})
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+
+    def test_decrypt_pool_decrypts_on_worker_processes(self):
+        """A token decrypted on the process pool matches one decrypted in process"""
+        encrypter = Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                              _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                              _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+        signed_jwt = encode({"RU": "12345678910", "survey": "BRS", "CC": "URN"})
+        pool = DecryptPool(processes=2, timeout=30)
+        try:
+            self.assertEqual(pool.decrypt_token(encrypter.encrypt_token(signed_jwt)), signed_jwt.encode())
+        finally:
+            pool.shutdown()
+
+    def encrypted_token(self):
+        encrypter = Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                              _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                              _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+        return encrypter.encrypt_token(encode({"RU": "12345678910", "survey": "BRS", "CC": "URN"}))
+
+    def test_decrypt_pool_timeout_raises_service_unavailable(self):
+        """A worker slower than the timeout raises ServiceUnavailable rather than a TimeoutError"""
+        pool = DecryptPool(processes=1, timeout=0)
+        try:
+            with self.assertRaises(ServiceUnavailable):
+                pool.decrypt_token(self.encrypted_token())
+        finally:
+            pool.shutdown()
+
+    def test_decrypt_pool_replaces_broken_pool(self):
+        """A dead worker raises ServiceUnavailable once and the next token is decrypted on a new pool"""
+        token = self.encrypted_token()
+        pool = DecryptPool(processes=1, timeout=30)
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        pool._executor = broken
+        try:
+            with self.assertRaises(ServiceUnavailable):
+                pool.decrypt_token(token)
+            self.assertIsNone(pool._executor)
+            self.assertIsNotNone(pool.decrypt_token(token))
+        finally:
+            pool.shutdown()
+
+    def test_check_jwt_returns_503_when_decryption_unavailable(self):
+        """An unavailable decryption pool becomes a 503 response instead of an unhandled error"""
+        with mock.patch('app.authentication.authenticator.decrypt_pool') as decrypt_pool:
+            decrypt_pool.decrypt_token.side_effect = ServiceUnavailable()
+            res = check_jwt('some.token.that.is.new')
+        self.assertEqual(res.status_code, 503)
+
+    def test_decrypt_pool_raises_worker_errors(self):
+        """A malformed token rejected on a worker process raises BadRequest in the caller"""
+        pool = DecryptPool(processes=1, timeout=30)
+        try:
+            with self.assertRaises(BadRequest):
+                pool.decrypt_token('not.a.token')
+        finally:
+            pool.shutdown()
@@ -51,8 +51,10 @@ class DraftTestCase(unittest.TestCase):
 
         Drafts.save_draft(draft, saver)
 
-        saver.save_message.assert_called_with(draft.data)
-        saver.save_msg_status.assert_called_with(draft.data.urn_from, draft.data.msg_id, Labels.DRAFT.value)
+        saver.save_message.assert_called_with(draft.data, commit=False)
+        saver.save_msg_status.assert_called_with(draft.data.urn_from, draft.data.msg_id, Labels.DRAFT.value,
+                                                 commit=False)
+        saver.commit.assert_called_once_with(mailboxes=['richard', 'torrance'])
 
     def test_draft_empty_to_field_returns_201(self):
         """Test draft can be saved without To field"""
@@ -0,0 +1,137 @@
+import unittest
+from flask import current_app
+from datetime import datetime
+from sqlalchemy import create_engine, event
+from app.application import app
+from app.repository import database
+from app.repository.database import SecureMessage, Status
+from app.repository.retriever import Retriever
+from app.validation.labels import Labels
+
+
+class IndexTestCase(unittest.TestCase):
+    """Test case checking hot queries are served by indexes rather than full scans"""
+
+    def setUp(self):
+        """setup test environment"""
+        app.testing = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////tmp/messages.db'
+        self.engine = create_engine('sqlite:////tmp/messages.db', echo=True)
+        with app.app_context():
+            database.db.init_app(current_app)
+            database.db.drop_all()
+            database.db.create_all()
+            self.db = database.db
+
+    def query_plan(self, statement):
+        """returns the sqlite query plan details for a statement"""
+        compiled = statement.compile(dialect=self.engine.dialect)
+        params = [compiled.params[name] for name in compiled.positiontup]
+        with self.engine.connect() as con:
+            rows = con.execute('EXPLAIN QUERY PLAN {0}'.format(compiled), *params)
+            return [row[-1] for row in rows]
+
+    def executed_plans(self, run):
+        """returns the sqlite query plan details of each statement run executes"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        engine = self.db.get_engine(current_app)
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            run()
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        with engine.connect() as con:
+            return [[row[-1] for row in con.execute('EXPLAIN QUERY PLAN {0}'.format(statement), parameters)]
+                    for statement, parameters in statements]
+
+    def assert_uses_index(self, plan, table):
+        """asserts every step touching table goes through an index"""
+        steps = [step for step in plan if ' {0} '.format(table) in '{0} '.format(step)]
+        self.assertTrue(len(steps) > 0, plan)
+        for step in steps:
+            self.assertTrue('USING' in step and 'INDEX' in step, plan)
+
+    def test_draft_check_uses_status_index(self):
+        """status lookup by msg_id and label as run by MessageSend.check_if_draft"""
+        with app.app_context():
+            query = Status.query.filter_by(msg_id='AMsgId', label=Labels.DRAFT.value)
+            self.assert_uses_index(self.query_plan(query.statement), 'status')
+
+    def test_remove_label_uses_status_index(self):
+        """status delete by label, msg_id and actor as run by Modifier.remove_label"""
+        statement = Status.__table__.delete().where(Status.label == Labels.ARCHIVE.value)\
+            .where(Status.msg_id == 'AMsgId').where(Status.actor == 'respondent.21345')
+        self.assert_uses_index(self.query_plan(statement), 'status')
+
+    def test_respondent_message_list_uses_indexes(self):
+        """message list for a respondent is ordered and filtered by index"""
+        with app.app_context():
+            query = SecureMessage.query.filter(Retriever._actor_filter('respondent.21345'))\
+                .order_by(SecureMessage.sent_date.desc(), SecureMessage.id.desc()).limit(15)
+            plan = self.query_plan(query.statement)
+            self.assert_uses_index(plan, 'status')
+            self.assert_uses_index(plan, 'secure_message')
+            self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+    def test_internal_message_list_uses_indexes(self):
+        """message list for an internal user is ordered and filtered by index"""
+        with app.app_context():
+            query = SecureMessage.query.filter(Retriever._actor_filter('internal.21345'))\
+                .order_by(SecureMessage.sent_date.desc(), SecureMessage.id.desc()).limit(15)
+            plan = self.query_plan(query.statement)
+            self.assert_uses_index(plan, 'status')
+            self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+    def test_keyset_message_list_pages_use_indexes(self):
+        """keyset pages in either direction are found and ordered without sorting the user's messages"""
+        cursors = [None, ('next', datetime(2017, 2, 3), 10), ('prev', datetime(2017, 2, 3), 10)]
+        with app.app_context():
+            with current_app.test_request_context():
+                for cursor in cursors:
+                    plan = self.executed_plans(
+                        lambda: Retriever.retrieve_message_list_by_cursor(cursor, 15, 'respondent.21345'))[0]
+                    self.assert_uses_index(plan, 'secure_message')
+                    self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+    def test_label_filtered_message_list_uses_status_index(self):
+        """a label filtered message list finds the label through the status index"""
+        with app.app_context():
+            for user_urn in ['respondent.21345', 'internal.21345']:
+                query = SecureMessage.query.filter(*Retriever._list_filters(user_urn, {'label': 'INBOX'}))\
+                    .order_by(SecureMessage.sent_date.desc(), SecureMessage.id.desc()).limit(15)
+                self.assert_uses_index(self.query_plan(query.statement), 'status')
+
+    def test_survey_filtered_message_list_uses_survey_index(self):
+        """an internal user's survey filtered message list is found and ordered by the survey index"""
+        with app.app_context():
+            query = SecureMessage.query.filter(*Retriever._list_filters('internal.21345', {'survey': 'ASurvey'}))\
+                .order_by(SecureMessage.sent_date.desc()).limit(15)
+            plan = self.query_plan(query.statement)
+            self.assertTrue(any('ix_secure_message_survey_sent_date' in step for step in plan), plan)
+
+    def test_thread_lookup_uses_thread_index(self):
+        """messages of a thread are found and ordered by the thread index"""
+        with app.app_context():
+            query = SecureMessage.query.filter(SecureMessage.thread_id == 'AThreadId')\
+                .order_by(SecureMessage.sent_date.asc(), SecureMessage.id.asc())
+            plan = self.query_plan(query.statement)
+            self.assertTrue(any('ix_secure_message_thread_id_sent_date' in step for step in plan), plan)
+            self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+    def test_missing_indexes_created_on_existing_tables(self):
+        """indexes dropped from an existing database are recreated at startup"""
+        with self.engine.connect() as con:
+            con.execute('DROP INDEX ix_status_actor_msg_id')
+        with app.app_context():
+            database.create_missing_indexes(self.db.engine)
+        with self.engine.connect() as con:
+            names = [row[1] for row in con.execute("PRAGMA index_list('status')")]
+        self.assertTrue('ix_status_actor_msg_id' in names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import time
+import unittest
+
+from app.common.lru import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    """Test case for the shared LRU cache"""
+
+    def test_evicts_least_recently_used(self):
+        """a full cache drops the entry used longest ago"""
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+    def test_entries_expire_after_ttl(self):
+        """an entry older than ttl reads as a miss"""
+        cache = LRUCache(10, ttl=0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_explicit_expiry_overrides_ttl(self):
+        """an entry given its own expiry time is dropped at that time"""
+        cache = LRUCache(10, ttl=300)
+        cache.put('a', 1, expires=time.time() - 1)
+        cache.put('b', 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_size_zero_caches_nothing(self):
+        """a max_size of 0 disables the cache"""
+        cache = LRUCache(0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_hits_and_misses_are_counted(self):
+        """each lookup counts as a hit or a miss"""
+        cache = LRUCache(10)
+        cache.get('a')
+        cache.put('a', 1)
+        cache.get('a')
+        cache.delete('a')
+        cache.get('a')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
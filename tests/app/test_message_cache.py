@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime
+from unittest.mock import Mock
+from app.repository.message_cache import ExternalBackend, ExternalStandIn, LocalBackend, MessageCache
+
+
+class MessageCacheTestCase(unittest.TestCase):
+    """Test case for the message cache and its backends"""
+
+    def setUp(self):
+        self.message = {'msg_id': 'AMsgId', 'subject': 'MyMessage', 'body': 'hello', 'thread_id': 'AThreadId',
+                        'sent_date': datetime(2017, 2, 3, 10, 30, 15, 123456), 'collection_case': 'ACollectionCase',
+                        'reporting_unit': 'AReportingUnit', 'survey': 'ASurvey', 'read_date': None,
+                        'labels': ['INBOX'], 'urn_to': ['respondent.1'], 'urn_from': 'ASurvey', '_links': ''}
+
+    def test_only_immutable_fields_are_cached(self):
+        """labels, read date and participants are left out of the cached fields"""
+        cache = MessageCache(LocalBackend(10))
+        cache.put(self.message)
+        fields = cache.get('AMsgId')
+        self.assertEqual(fields['body'], 'hello')
+        for field in ['labels', 'read_date', 'urn_to', 'urn_from']:
+            self.assertFalse(field in fields)
+
+    def test_local_backend_evicts_least_recently_used(self):
+        """a full local backend drops the entry used longest ago"""
+        backend = LocalBackend(2)
+        backend.set('a', {'msg_id': 'a'})
+        backend.set('b', {'msg_id': 'b'})
+        backend.get('a')
+        backend.set('c', {'msg_id': 'c'})
+        self.assertIsNone(backend.get('b'))
+        self.assertIsNotNone(backend.get('a'))
+
+    def test_local_backend_of_size_zero_caches_nothing(self):
+        """a size of 0 disables the local backend"""
+        cache = MessageCache(LocalBackend(0))
+        cache.put(self.message)
+        self.assertIsNone(cache.get('AMsgId'))
+
+    def test_external_backend_round_trips_fields(self):
+        """fields stored as json in an external store come back with their sent date"""
+        client = ExternalStandIn()
+        cache = MessageCache(ExternalBackend(client))
+        cache.put(self.message)
+        self.assertEqual(list(client.values), ['secure-message:message:AMsgId'])
+        fields = cache.get('AMsgId')
+        self.assertEqual(fields['sent_date'], self.message['sent_date'])
+        cache.invalidate('AMsgId')
+        self.assertIsNone(cache.get('AMsgId'))
+
+    def test_hits_and_misses_are_counted(self):
+        """each lookup counts as a hit or a miss once, by the message cache rather than its backend"""
+        backend = LocalBackend(10)
+        cache = MessageCache(backend)
+        cache.get('AMsgId')
+        cache.put(self.message)
+        cache.get('AMsgId')
+        cache.get('AMsgId')
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual((backend.hits, backend.misses), (0, 0))
+
+    def test_backend_failure_is_treated_as_miss(self):
+        """an unavailable external store does not fail the read"""
+        client = Mock(ExternalStandIn)
+        client.get.side_effect = Exception("unavailable")
+        client.set.side_effect = Exception("unavailable")
+        cache = MessageCache(ExternalBackend(client))
+        cache.put(self.message)
+        self.assertIsNone(cache.get('AMsgId'))
+        self.assertEqual(cache.misses, 1)
+
+    def test_backend_failure_on_clear_is_logged(self):
+        """a backend that cannot be cleared logs a warning rather than failing the caller"""
+        backend = Mock(LocalBackend)
+        backend.clear.side_effect = Exception("unavailable")
+        with self.assertLogs('app.repository.message_cache', level='WARNING') as logs:
+            MessageCache(backend).clear()
+        self.assertIn('Message cache clear failed unavailable', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from flask import current_app
+
+from app import application
+from app.application import app
+from app.authentication.jwe import DecryptPool
+from app.common.alerts import alert_dispatcher
+from app.common.metrics import Exposition, Histogram, metrics
+from app.repository import database
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Test case for the metrics endpoint and its collectors"""
+
+    def setUp(self):
+        self.app = application.app.test_client()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////tmp/messages.db'
+        with app.app_context():
+            database.db.init_app(current_app)
+            database.db.drop_all()
+            database.db.create_all()
+
+    def scrape(self):
+        response = self.app.get("http://localhost:5050/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], Exposition.CONTENT_TYPE)
+        return response.data.decode().splitlines()
+
+    def sample(self, lines, name):
+        """the value of the sample line starting with name"""
+        for line in lines:
+            if line.startswith(name + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        self.fail("{0} not found".format(name))
+
+    def test_metrics_needs_no_user_urn(self):
+        """metrics can be scraped without a user urn like the health checks"""
+        response = self.app.get("http://localhost:5050/metrics")
+        self.assertEqual(response.status_code, 200)
+
+    def test_requests_are_counted_and_timed_per_resource(self):
+        """each request adds to its resource's count and latency histogram"""
+        requests = 'secure_message_requests_total{method="GET",resource="messagelist",status="200"}'
+        latency = 'secure_message_request_duration_seconds_count{method="GET",resource="messagelist"}'
+        before = self.scrape()
+        before_requests = self.sample(before, requests) if any(line.startswith(requests) for line in before) else 0
+        before_latency = self.sample(before, latency) if any(line.startswith(latency) for line in before) else 0
+
+        self.app.get("http://localhost:5050/messages", headers={'user_urn': 'respondent.21345'})
+        self.app.get("http://localhost:5050/messages", headers={'user_urn': 'respondent.21345'})
+
+        after = self.scrape()
+        self.assertEqual(self.sample(after, requests), before_requests + 2)
+        self.assertEqual(self.sample(after, latency), before_latency + 2)
+        self.assertIn('secure_message_request_duration_seconds_bucket{le="+Inf",method="GET",resource="messagelist"} ' +
+                      str(int(before_latency + 2)), after)
+
+    def test_metrics_cover_pool_decrypt_notifications_and_caches(self):
+        """every source of metrics is present in a scrape"""
+        lines = self.scrape()
+        self.assertGreater(self.sample(lines, 'secure_message_db_pool_checkouts_total'), 0)
+        self.assertEqual(self.sample(lines, 'secure_message_notification_queue_depth'), alert_dispatcher.queue_depth)
+        self.assertEqual(self.sample(lines, 'secure_message_notifications_total{outcome="failed"}'),
+                         alert_dispatcher.failed_count)
+        for cache in ('token', 'list_total', 'message'):
+            self.sample(lines, 'secure_message_cache_hit_ratio{{cache="{0}"}}'.format(cache))
+        self.sample(lines, 'secure_message_token_decrypt_seconds_count')
+
+    def test_decrypt_is_timed_even_when_it_fails(self):
+        """decryption failures are timed as well as successes"""
+        before = metrics.decrypt_seconds.count
+        with self.assertRaises(Exception):
+            DecryptPool(processes=0).decrypt_token('not.a.valid.token.at_all')
+        self.assertEqual(metrics.decrypt_seconds.count, before + 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """observations count towards their bucket and every larger one"""
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1.0, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_exposition_escapes_label_values(self):
+        """quotes and backslashes in label values are escaped"""
+        exposition = Exposition()
+        exposition.gauge('example', 'An example', [({'name': 'a"b\\c'}, 1)])
+        self.assertEqual(exposition.text(), '# HELP example An example\n# TYPE example gauge\n'
+                                            'example{name="a\\"b\\\\c"} 1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
 import unittest
 import uuid
+from unittest import mock
 from flask import current_app
 from sqlalchemy import create_engine
 from app.validation.labels import Labels
 from app.application import app
 from app.repository import database
+from app.repository import counters as counters_module
+from app.repository import modifier as modifier_module
+from app.repository.counters import LabelCounter, MailboxVersions
 from app.repository.modifier import Modifier
 from app.repository.retriever import Retriever
 
@@ -243,3 +247,159 @@ class ModifyTestCase(unittest.TestCase):
                 self.assertCountEqual(message['labels'], ['UNREAD', 'INBOX'])
                 message = message_service.retrieve_message(msg_id, 'internal.21345')
                 self.assertCountEqual(message['labels'], ['UNREAD', 'INBOX'])
+
+    def retrieve_all(self, user_urn):
+        """returns every message in the database serialized for user_urn"""
+        with self.engine.connect() as con:
+            msg_ids = [row[0] for row in con.execute('SELECT msg_id FROM secure_message')]
+        return [Retriever().retrieve_message(msg_id, user_urn) for msg_id in msg_ids]
+
+    def test_archive_label_added_and_removed_for_many_messages(self):
+        """testing a label is added to then removed from many messages at once"""
+        self.populate_database(5)
+        with app.app_context():
+            with current_app.test_request_context():
+                messages = self.retrieve_all('respondent.21345')
+                Modifier.add_label_many(Labels.ARCHIVE.value, messages, 'respondent.21345')
+                for message in self.retrieve_all('respondent.21345'):
+                    self.assertCountEqual(message['labels'], ['SENT', 'ARCHIVE'])
+
+                Modifier.remove_label_many(Labels.ARCHIVE.value, messages, 'respondent.21345')
+                for message in self.retrieve_all('respondent.21345'):
+                    self.assertCountEqual(message['labels'], ['SENT'])
+
+    def test_unread_removed_and_read_date_set_for_many_messages(self):
+        """testing mark all read removes unread and sets read date on every message"""
+        self.populate_database(5)
+        with app.app_context():
+            with current_app.test_request_context():
+                Modifier.del_unread_many(self.retrieve_all('internal.21345'), 'internal.21345')
+                for message in self.retrieve_all('internal.21345'):
+                    self.assertCountEqual(message['labels'], ['INBOX'])
+                    self.assertTrue(message['read_date'] is not None)
+
+    def test_label_values_are_bound_not_formatted(self):
+        """testing an actor containing a quote is stored as given rather than breaking the statement"""
+        self.populate_database(1)
+        with app.app_context():
+            with current_app.test_request_context():
+                message = self.retrieve_all("respondent.o'brien")[0]
+                Modifier.add_label(Labels.ARCHIVE.value, message, "respondent.o'brien")
+                message = self.retrieve_all("respondent.o'brien")[0]
+                self.assertEqual(message['labels'], ['ARCHIVE'])
+                Modifier.remove_label(Labels.ARCHIVE.value, message, "respondent.o'brien")
+                message = self.retrieve_all("respondent.o'brien")[0]
+                self.assertEqual(message['labels'], [])
+
+    def test_prepared_statements_compiled_once(self):
+        """testing repeated label changes reuse the cached compiled statement"""
+        self.populate_database(2)
+        modifier_module._compiled_cache.clear()
+        with app.app_context():
+            with current_app.test_request_context():
+                for message in self.retrieve_all('respondent.21345'):
+                    Modifier.add_label(Labels.ARCHIVE.value, message, 'respondent.21345')
+                    Modifier.remove_label(Labels.ARCHIVE.value, message, 'respondent.21345')
+        self.assertEqual(len(modifier_module._compiled_cache), 2)
+
+    def label_counts(self, actor):
+        """returns the stored {label: count} for an actor"""
+        with app.app_context():
+            return LabelCounter.counts(database.db.session, actor)
+
+    def build_label_counts(self):
+        """counts statuses inserted directly by populate_database"""
+        with app.app_context():
+            LabelCounter.rebuild(database.db.session)
+            database.db.session.commit()
+
+    def test_rebuild_counts_existing_statuses(self):
+        """testing a rebuild counts every status row by actor and label"""
+        self.populate_database(3)
+        self.build_label_counts()
+        self.assertEqual(self.label_counts('SurveyType'), {'INBOX': 3, 'UNREAD': 3})
+        self.assertEqual(self.label_counts('respondent.21345'), {'SENT': 3})
+
+    def test_label_counts_follow_added_and_removed_labels(self):
+        """testing label counts change with labels added to and removed from messages"""
+        self.populate_database(3)
+        self.build_label_counts()
+        with app.app_context():
+            with current_app.test_request_context():
+                messages = self.retrieve_all('respondent.21345')
+                Modifier.add_label_many(Labels.ARCHIVE.value, messages, 'respondent.21345')
+                self.assertEqual(self.label_counts('respondent.21345')['ARCHIVE'], 3)
+
+                Modifier.remove_label(Labels.ARCHIVE.value, messages[0], 'respondent.21345')
+                self.assertEqual(self.label_counts('respondent.21345')['ARCHIVE'], 2)
+
+                Modifier.del_unread_many(self.retrieve_all('internal.21345'), 'internal.21345')
+                self.assertEqual(self.label_counts('SurveyType'), {'INBOX': 3, 'UNREAD': 0})
+
+    def test_removing_absent_label_does_not_change_count(self):
+        """testing a remove that deletes no rows leaves the count alone"""
+        self.populate_database(1)
+        self.build_label_counts()
+        with app.app_context():
+            with current_app.test_request_context():
+                message = self.retrieve_all('respondent.21345')[0]
+                Modifier.remove_label(Labels.ARCHIVE.value, message, 'respondent.21345')
+        self.assertEqual(self.label_counts('respondent.21345'), {'SENT': 1})
+
+    def test_deleting_draft_decrements_draft_count(self):
+        """testing deleting a draft removes its draft labels from the counts"""
+        with self.engine.connect() as con:
+            con.execute("INSERT INTO secure_message(msg_id, subject, body) VALUES ('test123', 'test', 'test')")
+            con.execute("INSERT INTO status (label, msg_id, actor) VALUES ('DRAFT', 'test123', 'respondent.richard')")
+        self.build_label_counts()
+        with app.app_context():
+            with current_app.test_request_context():
+                Modifier.del_draft('test123')
+        self.assertEqual(self.label_counts('respondent.richard'), {'DRAFT': 0})
+
+    def test_count_row_inserted_concurrently_is_updated(self):
+        """testing a count row another writer inserts between the update and insert is incremented, not duplicated"""
+        with self.engine.connect() as con:
+            con.execute("INSERT INTO label_count (actor, label, count) VALUES ('SurveyType', 'INBOX', 1)")
+        with app.app_context():
+            session = database.db.session
+            executor = mock.Mock(wraps=session)
+            updates = []
+
+            def execute(statement, params=None):
+                """the first update finds no row as if it ran before the other writer's insert"""
+                if statement is counters_module.INCREMENT_COUNT and not updates:
+                    updates.append(params)
+                    return mock.Mock(rowcount=0)
+                return session.execute(statement, params)
+
+            executor.execute.side_effect = execute
+            LabelCounter.adjust(executor, {('SurveyType', 'INBOX'): 1})
+            session.commit()
+        self.assertEqual(self.label_counts('SurveyType'), {'INBOX': 2})
+
+    def test_label_change_bumps_participant_and_survey_mailboxes(self):
+        """testing a respondent's label change bumps their mailbox and the message survey's but not others"""
+        self.populate_database(1)
+        mailboxes = [('respondent.21345', None), ('internal.21345', 'SurveyType'), ('internal.21345', None),
+                     ('internal.21345', 'OtherSurvey'), ('respondent.99999', None)]
+        with app.app_context():
+            with current_app.test_request_context():
+                session = database.db.session
+                before = [MailboxVersions.version(session, urn, survey) for urn, survey in mailboxes]
+                message = self.retrieve_all('respondent.21345')[0]
+                Modifier.add_label(Labels.ARCHIVE.value, message, 'respondent.21345')
+                after = [MailboxVersions.version(session, urn, survey) for urn, survey in mailboxes]
+        self.assertEqual([new > old for old, new in zip(before, after)], [True, True, True, False, False])
+
+    def test_deleting_draft_removes_it_from_search_index(self):
+        """testing a deleted draft can no longer be found by search"""
+        with self.engine.connect() as con:
+            con.execute("INSERT INTO secure_message(id, msg_id, subject, body) VALUES (7, 'test123', 'findme', 'x')")
+            con.execute("INSERT INTO message_search(rowid, msg_id, subject, body) VALUES (7, 'test123', 'findme', 'x')")
+            con.execute("INSERT INTO status (label, msg_id, actor) VALUES ('DRAFT', 'test123', 'respondent.richard')")
+        with app.app_context():
+            with current_app.test_request_context():
+                Modifier.del_draft('test123')
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM message_search").scalar(), 0)
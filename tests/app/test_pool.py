@@ -0,0 +1,86 @@
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from app import application, settings
+from app.common.metrics import metrics
+from app.repository.pool import ping_connection, PooledSQLAlchemy
+
+
+class PoolTestCase(unittest.TestCase):
+    """Test case for connection pool configuration"""
+
+    POSTGRES = make_url('postgresql://rasmessage@localhost/messages')
+
+    def engine_options(self, url, **config):
+        """the create_engine options a PooledSQLAlchemy builds for url with the given app config"""
+        pool_app = Flask(__name__)
+        pool_app.config['SQLALCHEMY_DATABASE_URI'] = str(url)
+        pool_app.config.update(config)
+        db = PooledSQLAlchemy(pool_app)
+        options = {}
+        db.apply_pool_defaults(pool_app, options)
+        db.apply_driver_hacks(pool_app, url, options)
+        return options
+
+    def test_queue_pool_options_are_passed_to_the_engine(self):
+        """size, overflow, timeout and recycle settings reach create_engine"""
+        options = self.engine_options(self.POSTGRES, SQLALCHEMY_POOL_SIZE=10, SQLALCHEMY_MAX_OVERFLOW=5,
+                                      SQLALCHEMY_POOL_TIMEOUT=3, SQLALCHEMY_POOL_RECYCLE=1800)
+        self.assertEqual((options['pool_size'], options['max_overflow'], options['pool_timeout'],
+                          options['pool_recycle']), (10, 5, 3, 1800))
+        self.assertNotIn('poolclass', options)
+        self.assertNotIn('pool_events', options)
+
+    def test_pre_ping_adds_checkout_listener(self):
+        """pre-ping pings connections as they are checked out"""
+        options = self.engine_options(self.POSTGRES, SQLALCHEMY_POOL_PRE_PING=True)
+        self.assertEqual(options['pool_events'], [(ping_connection, 'checkout')])
+
+    def test_null_pool_drops_queue_options(self):
+        """the null pool opens a connection per checkout and ignores sizes and pre-ping"""
+        options = self.engine_options(self.POSTGRES, SQLALCHEMY_POOL_CLASS='null', SQLALCHEMY_POOL_SIZE=10,
+                                      SQLALCHEMY_MAX_OVERFLOW=5, SQLALCHEMY_POOL_PRE_PING=True)
+        self.assertIs(options['poolclass'], NullPool)
+        for option in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_events'):
+            self.assertNotIn(option, options)
+
+    def test_sqlite_engine_ignores_queue_options(self):
+        """sizes set for a production database do not stop a SQLite engine being created"""
+        url = make_url('sqlite:////tmp/messages.db')
+        options = self.engine_options(url, SQLALCHEMY_POOL_SIZE=10, SQLALCHEMY_MAX_OVERFLOW=5)
+        self.assertEqual(create_engine(url, **options).execute('SELECT 1').scalar(), 1)
+
+    def test_pre_ping_replaces_stale_connection(self):
+        """a pooled connection closed underneath the pool is discarded and replaced on checkout"""
+        engine = create_engine('sqlite:////tmp/messages.db', poolclass=QueuePool, pool_size=1,
+                               pool_events=[(ping_connection, 'checkout')])
+        connection = engine.connect()
+        stale = connection.connection.connection
+        connection.close()
+        stale.close()
+        invalidations = metrics.snapshot()[2].get('invalidate', 0)
+
+        self.assertEqual(engine.execute('SELECT 1').scalar(), 1)
+        self.assertEqual(metrics.snapshot()[2].get('invalidate', 0), invalidations + 1)
+
+    def test_optional_int_settings(self):
+        """pool sizes are read as integers, unset or empty values mean SQLAlchemy's default"""
+        with mock.patch.dict(os.environ, {'SM_TEST_SIZE': '20', 'SM_TEST_EMPTY': ''}):
+            self.assertEqual(settings._optional_int('SM_TEST_SIZE'), 20)
+            self.assertIsNone(settings._optional_int('SM_TEST_EMPTY'))
+            self.assertIsNone(settings._optional_int('SM_TEST_UNSET'))
+
+    def test_metrics_report_pool_class(self):
+        """the pool class in use is reported with the pool metrics"""
+        response = application.app.test_client().get("http://localhost:5050/metrics")
+        self.assertIn('secure_message_db_pool_info{pool_class="NullPool"} 1', response.data.decode().splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+
+from flask import current_app, json
+
+from app import application
+from app.application import app
+from app.common.alerts import AlertUser, AlertViaGovNotify
+from app.common.query_stats import query_stats, QueryStats
+from app.repository import database
+
+
+class QueryStatsTestCase(unittest.TestCase):
+    """Test case for per request SQL instrumentation"""
+
+    def setUp(self):
+        self.app = application.app.test_client()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////tmp/messages.db'
+        AlertUser.alert_method = mock.Mock(AlertViaGovNotify)
+        self.headers, self.slow_query_ms = query_stats.headers, query_stats.slow_query_ms
+        query_stats.headers = True
+        with app.app_context():
+            database.db.init_app(current_app)
+            database.db.drop_all()
+            database.db.create_all()
+
+    def tearDown(self):
+        query_stats.headers, query_stats.slow_query_ms = self.headers, self.slow_query_ms
+
+    def send_message(self):
+        message = {'urn_to': 'richard', 'urn_from': 'respondent.21345', 'subject': 'MyMessage', 'body': 'hello',
+                   'thread_id': "", 'collection_case': 'ACollectionCase', 'reporting_unit': 'AReportingUnit',
+                   'survey': 'test-123'}
+        response = self.app.post("http://localhost:5050/message/send", data=json.dumps(message),
+                                 headers={'Content-Type': 'application/json', 'user_urn': 'respondent.21345'})
+        return json.loads(response.data)['msg_id']
+
+    def test_response_headers_carry_query_count_and_time(self):
+        """a request that reads the database reports its statements in the response headers"""
+        msg_id = self.send_message()
+        response = self.app.get("http://localhost:5050/message/{0}".format(msg_id),
+                                headers={'user_urn': 'respondent.21345'})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response.headers['X-SQL-Query-Count']), 0)
+        self.assertGreaterEqual(float(response.headers['X-SQL-Time-Ms']),
+                                float(response.headers['X-SQL-Slowest-Ms']))
+
+    def test_statements_on_bare_connections_are_counted(self):
+        """modifier statements run on the session connection directly and are still counted"""
+        msg_id = self.send_message()
+        headers = {'Content-Type': 'application/json', 'user_urn': 'respondent.21345'}
+        response = self.app.put("http://localhost:5050/message/{0}/modify".format(msg_id), headers=headers,
+                                data=json.dumps({'action': 'add', 'label': 'ARCHIVE'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(int(response.headers['X-SQL-Query-Count']), 3)
+
+    def test_request_without_queries_reports_zero(self):
+        """the health check runs no statements"""
+        response = self.app.get("http://localhost:5050/health")
+        self.assertEqual(response.headers['X-SQL-Query-Count'], '0')
+
+    def test_headers_absent_when_disabled(self):
+        """no instrumentation headers are added unless the setting is on"""
+        query_stats.headers = False
+        response = self.app.get("http://localhost:5050/messages", headers={'user_urn': 'respondent.21345'})
+        self.assertNotIn('X-SQL-Query-Count', response.headers)
+
+    def test_request_is_logged_with_slowest_statement(self):
+        """each instrumented request logs its query count and slowest statement"""
+        with self.assertLogs('app.common.query_stats', level='INFO') as logs:
+            self.app.get("http://localhost:5050/messages", headers={'user_urn': 'respondent.21345'})
+        self.assertIn('GET /messages status=200 queries=', logs.output[-1])
+        self.assertIn('slowest=SELECT', logs.output[-1])
+
+    def test_slow_queries_are_logged(self):
+        """statements at or above the threshold are logged as slow"""
+        query_stats.headers = False
+        query_stats.slow_query_ms = 0.000001
+        with self.assertLogs('app.common.query_stats', level='WARNING') as logs:
+            self.app.get("http://localhost:5050/messages", headers={'user_urn': 'respondent.21345'})
+        self.assertTrue(any('Slow query took' in line for line in logs.output))
+
+    def test_record_keeps_slowest_statement(self):
+        """record adds up time and keeps the slowest statement"""
+        stats = QueryStats.new_stats()
+        QueryStats.record(stats, 'SELECT 1', 2.0)
+        QueryStats.record(stats, 'SELECT 2', 5.0)
+        QueryStats.record(stats, 'SELECT 3', 1.0)
+        self.assertEqual(stats, {'count': 3, 'total_ms': 8.0, 'slowest_ms': 5.0, 'slowest': 'SELECT 2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,14 @@ import unittest
 import uuid
 from flask import current_app
 from flask import json
-from sqlalchemy import create_engine
-from werkzeug.exceptions import NotFound, InternalServerError
+from sqlalchemy import create_engine, event
+from werkzeug.exceptions import BadRequest, NotFound, InternalServerError
 from app.application import app
 from app.repository import database
-from app.repository.retriever import Retriever
+from app.repository.message_cache import message_cache
+from app.repository.modifier import Modifier
+from app.repository.retriever import Retriever, total_cache
+from app.repository.search import SearchIndex
 from app.resources.messages import MessageList
 from app.settings import MESSAGE_QUERY_LIMIT
 
@@ -25,6 +28,7 @@ class RetrieverTestCase(unittest.TestCase):
             database.db.drop_all()
             database.db.create_all()
             self.db = database.db
+        message_cache.clear()
 
     def populate_database(self, x=0):
         with self.engine.connect() as con:
@@ -32,7 +36,7 @@ class RetrieverTestCase(unittest.TestCase):
                 msg_id = str(uuid.uuid4())
                 query = 'INSERT INTO secure_message(id, msg_id, subject, body, thread_id, sent_date, read_date,' \
                         ' collection_case, reporting_unit, survey) VALUES ({0}, "{1}", "test","test","", ' \
-                        '"2017-02-03 00:00:00", "2017-02-03 00:00:00", "ACollectionCase", "AReportingUnit", ' \
+                        '"2017-02-03 00:00:00.000000", "2017-02-03 00:00:00", "ACollectionCase", "AReportingUnit", ' \
                         '"SurveyType")'.format(i, msg_id)
                 con.execute(query)
                 query = 'INSERT INTO status(label, msg_id, actor) VALUES("SENT", "{0}", "respondent.21345")'.format(
@@ -49,7 +53,7 @@ class RetrieverTestCase(unittest.TestCase):
         """retrieves messages from empty database"""
         with app.app_context():
             with current_app.test_request_context():
-                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 msg = []
                 for message in response.items:
                     msg.append(message.serialize)
@@ -61,7 +65,7 @@ class RetrieverTestCase(unittest.TestCase):
             database.db.drop_all()
             with current_app.test_request_context():
                 with self.assertRaises(InternalServerError):
-                    Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)
+                    Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')
 
     def test_all_msg_returned_when_db_less_than_limit(self):
         """retrieves messages from database with less entries than retrieval amount"""
@@ -69,7 +73,7 @@ class RetrieverTestCase(unittest.TestCase):
 
         with app.app_context():
             with current_app.test_request_context():
-                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 msg = []
                 for message in response.items:
                     msg.append(message.serialize)
@@ -80,12 +84,384 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT+5)
         with app.app_context():
             with current_app.test_request_context():
-                status, response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)
+                status, response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')
                 msg = []
                 for message in response.items:
                     msg.append(message.serialize)
                 self.assertEqual(len(msg), MESSAGE_QUERY_LIMIT)
 
+    def test_msg_list_excludes_messages_for_other_respondents(self):
+        """retrieves messages for a respondent that has no status rows in the database"""
+        self.populate_database(5)
+        with app.app_context():
+            with current_app.test_request_context():
+                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.99999')[1]
+                self.assertEqual(len(response.items), 0)
+
+    def test_msg_list_returns_survey_messages_for_internal_user(self):
+        """retrieves messages for an internal user labelled against the message survey"""
+        self.populate_database(5)
+        with app.app_context():
+            with current_app.test_request_context():
+                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'internal.21345')[1]
+                self.assertEqual(len(response.items), 5)
+
+    def count_queries(self, func):
+        """returns the number of statements executed against the database while running func"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = self.db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            func()
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def test_msg_list_query_count_is_constant_per_page(self):
+        """serializing a page of messages does not issue a status query per message"""
+        def serialize_page(limit):
+            response = Retriever().retrieve_message_list(1, limit, 'respondent.21345')[1]
+            for message in response.items:
+                message.serialize('respondent.21345')
+
+        self.populate_database(MESSAGE_QUERY_LIMIT)
+        with app.app_context():
+            with current_app.test_request_context():
+                single_message_count = self.count_queries(lambda: serialize_page(1))
+                full_page_count = self.count_queries(lambda: serialize_page(MESSAGE_QUERY_LIMIT))
+
+        self.assertEqual(single_message_count, full_page_count)
+
+    def test_msg_list_without_total_does_not_count(self):
+        """a page is fetched with one more row than the limit instead of a count query"""
+        self.populate_database(MESSAGE_QUERY_LIMIT + 1)
+        with app.app_context():
+            with current_app.test_request_context():
+                without_total = self.count_queries(
+                    lambda: Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'none'))
+                exact = self.count_queries(
+                    lambda: Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'exact'))
+                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'none')[1]
+        self.assertEqual(without_total, exact - 1)
+        self.assertEqual(len(response.items), MESSAGE_QUERY_LIMIT)
+        self.assertTrue(response.has_next)
+        self.assertIsNone(response.total)
+
+    def test_msg_list_approximate_total_is_cached(self):
+        """an approximate total is counted once and served from the cache until it expires"""
+        self.populate_database(3)
+        total_cache.clear()
+        with app.app_context():
+            with current_app.test_request_context():
+                first = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'approximate')
+                query_count = self.count_queries(
+                    lambda: Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345',
+                                                              'approximate'))
+                none_count = self.count_queries(
+                    lambda: Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'none'))
+        total_cache.clear()
+        self.assertEqual(first[1].total, 3)
+        self.assertEqual(query_count, none_count)
+
+    def test_msg_list_exact_total_counts_messages(self):
+        """exact mode reports the total visible to the user"""
+        self.populate_database(MESSAGE_QUERY_LIMIT + 2)
+        with app.app_context():
+            with current_app.test_request_context():
+                response = Retriever().retrieve_message_list(2, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'exact')[1]
+        self.assertEqual(response.total, MESSAGE_QUERY_LIMIT + 2)
+        self.assertEqual(len(response.items), 2)
+        self.assertFalse(response.has_next)
+        self.assertTrue(response.has_prev)
+
+    def test_msg_list_filtered_by_label_returns_only_labelled_messages(self):
+        """filtering by label returns full pages of messages the user has that label on"""
+        self.populate_database(MESSAGE_QUERY_LIMIT * 3)
+        with self.engine.connect() as con:
+            con.execute('INSERT INTO status(label, msg_id, actor) SELECT "ARCHIVE", msg_id, "respondent.21345" '
+                        'FROM secure_message WHERE id % 2 = 0')
+        with app.app_context():
+            with current_app.test_request_context():
+                response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345',
+                                                             filters={'label': 'ARCHIVE'})[1]
+                self.assertEqual(len(response.items), MESSAGE_QUERY_LIMIT)
+                self.assertTrue(response.has_next)
+                for message in response.items:
+                    self.assertTrue('ARCHIVE' in message.serialize('respondent.21345')['labels'])
+
+    def test_msg_list_label_filter_uses_internal_users_survey_labels(self):
+        """an internal user's label filter matches labels held by the message survey"""
+        self.populate_database(3)
+        with self.engine.connect() as con:
+            con.execute('DELETE FROM status WHERE label = "UNREAD" AND msg_id = '
+                        '(SELECT msg_id FROM secure_message WHERE id = 0)')
+        with app.app_context():
+            with current_app.test_request_context():
+                unread = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'internal.21345',
+                                                           filters={'label': 'UNREAD'})[1]
+                sent = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'internal.21345',
+                                                         filters={'label': 'SENT'})[1]
+        self.assertEqual(sorted(message.id for message in unread.items), [1, 2])
+        self.assertEqual(sent.items, [])
+
+    def test_msg_list_filtered_by_message_fields(self):
+        """filtering by survey, reporting unit and collection case matches those message fields"""
+        self.populate_database(4)
+        with self.engine.connect() as con:
+            con.execute('UPDATE secure_message SET survey = "OtherSurvey", reporting_unit = "OtherUnit", '
+                        'collection_case = "OtherCase" WHERE id = 3')
+        with app.app_context():
+            with current_app.test_request_context():
+                for filters in [{'survey': 'OtherSurvey'}, {'reporting_unit': 'OtherUnit'},
+                                {'collection_case': 'OtherCase'}]:
+                    response = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345',
+                                                                 filters=filters)[1]
+                    self.assertEqual([message.id for message in response.items], [3])
+                response = Retriever().retrieve_message_list_by_cursor(None, MESSAGE_QUERY_LIMIT, 'respondent.21345',
+                                                                       {'reporting_unit': 'AReportingUnit'})[1]
+                self.assertEqual(sorted(message.id for message in response.items), [0, 1, 2])
+
+    def test_retrieve_message_loads_labels_in_one_query(self):
+        """retrieving a message by id loads its statuses with the message"""
+        self.populate_database(1)
+        with self.engine.connect() as con:
+            msg_id = con.execute('SELECT msg_id FROM secure_message LIMIT 1').first()[0]
+        with app.app_context():
+            with current_app.test_request_context():
+                query_count = self.count_queries(lambda: Retriever().retrieve_message(msg_id, 'respondent.21345'))
+        self.assertEqual(query_count, 1)
+
+    def test_cached_message_is_read_without_its_body(self):
+        """a second retrieval of a message reads only its read date and statuses"""
+        self.populate_database(1)
+        with self.engine.connect() as con:
+            msg_id = con.execute('SELECT msg_id FROM secure_message LIMIT 1').first()[0]
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            with current_app.test_request_context():
+                first = Retriever().retrieve_message(msg_id, 'internal.21345')
+                engine = self.db.get_engine(app)
+                event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+                try:
+                    second = Retriever().retrieve_message(msg_id, 'internal.21345')
+                finally:
+                    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual(len(statements), 1)
+        self.assertFalse('body' in statements[0])
+        self.assertEqual(second, first)
+
+    def test_cached_message_has_fresh_labels(self):
+        """labels added after a message is cached are returned with it"""
+        self.populate_database(1)
+        with self.engine.connect() as con:
+            msg_id = con.execute('SELECT msg_id FROM secure_message LIMIT 1').first()[0]
+        with app.app_context():
+            with current_app.test_request_context():
+                message = Retriever().retrieve_message(msg_id, 'respondent.21345')
+                Modifier.add_label('ARCHIVE', message, 'respondent.21345')
+                message = Retriever().retrieve_message(msg_id, 'respondent.21345')
+        self.assertCountEqual(message['labels'], ['SENT', 'ARCHIVE'])
+        self.assertEqual(message['urn_to'], ['SurveyType'])
+
+    def test_deleted_message_is_not_served_from_cache(self):
+        """a cached draft that has been deleted is not found"""
+        self.populate_database(1)
+        with self.engine.connect() as con:
+            msg_id = con.execute('SELECT msg_id FROM secure_message LIMIT 1').first()[0]
+            con.execute('INSERT INTO status(label, msg_id, actor) VALUES("DRAFT", "{0}", "respondent.21345")'
+                        .format(msg_id))
+        with app.app_context():
+            with current_app.test_request_context():
+                Retriever().retrieve_message(msg_id, 'respondent.21345')
+                with self.engine.connect() as con:
+                    con.execute('DELETE FROM status WHERE msg_id = "{0}"'.format(msg_id))
+                    con.execute('DELETE FROM secure_message WHERE msg_id = "{0}"'.format(msg_id))
+                with self.assertRaises(NotFound):
+                    Retriever().retrieve_message(msg_id, 'respondent.21345')
+
+    def test_keyset_pages_cover_all_messages_once(self):
+        """walks every keyset page forwards checking each message is returned exactly once"""
+        self.populate_database(MESSAGE_QUERY_LIMIT * 2 + 3)
+        with app.app_context():
+            with current_app.test_request_context():
+                seen = []
+                cursor = None
+                for _ in range(MESSAGE_QUERY_LIMIT):
+                    page = Retriever().retrieve_message_list_by_cursor(cursor, MESSAGE_QUERY_LIMIT,
+                                                                       'respondent.21345')[1]
+                    seen.extend(message.id for message in page.items)
+                    if not page.has_next:
+                        break
+                    last = page.items[-1]
+                    cursor = ('next', last.sent_date, last.id)
+                self.assertEqual(len(seen), MESSAGE_QUERY_LIMIT * 2 + 3)
+                self.assertEqual(len(set(seen)), len(seen))
+
+    def test_keyset_prev_page_returns_previous_messages(self):
+        """moving back from the second keyset page returns the first page in the same order"""
+        self.populate_database(MESSAGE_QUERY_LIMIT * 2)
+        with app.app_context():
+            with current_app.test_request_context():
+                first = Retriever().retrieve_message_list_by_cursor(None, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+                last = first.items[-1]
+                second = Retriever().retrieve_message_list_by_cursor(('next', last.sent_date, last.id),
+                                                                     MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+                top = second.items[0]
+                back = Retriever().retrieve_message_list_by_cursor(('prev', top.sent_date, top.id),
+                                                                   MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+                self.assertFalse(first.has_prev)
+                self.assertTrue(second.has_prev)
+                self.assertFalse(second.has_next)
+                self.assertFalse(back.has_prev)
+                self.assertEqual([message.id for message in back.items], [message.id for message in first.items])
+
+    def test_keyset_to_json_returns_next_cursor(self):
+        """turns keyset page to json checking next link carries a cursor"""
+        self.populate_database(MESSAGE_QUERY_LIMIT + 1)
+        with app.app_context():
+            with current_app.test_request_context():
+                resp = Retriever().retrieve_message_list_by_cursor(None, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+                json_data = MessageList()._keyset_list_to_json(resp, '', MESSAGE_QUERY_LIMIT,
+                                                               "http://localhost:5050/", 'respondent.21345')
+                data = json.loads(json_data.get_data())
+                self.assertTrue('next' in data['_links'])
+                self.assertFalse('prev' in data['_links'])
+                cursor = data['_links']['next']['href'].split('cursor=')[1].split('&')[0]
+                self.assertEqual(MessageList._decode_cursor(cursor)[0], 'next')
+
+    def populate_threads(self, threads, messages_per_thread):
+        """adds threads of messages sent by respondent.21345, later messages in a thread have later sent dates"""
+        with self.engine.connect() as con:
+            for thread in range(threads):
+                for position in range(messages_per_thread):
+                    row_id = thread * messages_per_thread + position
+                    msg_id = str(uuid.uuid4())
+                    con.execute('INSERT INTO secure_message(id, msg_id, subject, body, thread_id, sent_date, survey) '
+                                'VALUES ({0}, "{1}", "test", "test", "thread-{2}", "2017-02-0{3} 00:00:00.000000", '
+                                '"SurveyType")'.format(row_id, msg_id, thread, position + 1))
+                    con.execute('INSERT INTO status(label, msg_id, actor) VALUES("SENT", "{0}", "respondent.21345")'
+                                .format(msg_id))
+                    con.execute('INSERT INTO status(label, msg_id, actor) VALUES("INBOX", "{0}", "SurveyType")'
+                                .format(msg_id))
+
+    def test_retrieve_thread_returns_messages_oldest_first(self):
+        """retrieves every message of one thread in the order they were sent"""
+        self.populate_threads(2, 3)
+        with app.app_context():
+            with current_app.test_request_context():
+                messages = Retriever().retrieve_thread('thread-1', 'respondent.21345')
+                self.assertEqual([message.id for message in messages], [3, 4, 5])
+
+    def test_retrieve_thread_raises_not_found_for_unknown_thread(self):
+        """retrieving a thread the user has no messages in raises NotFound"""
+        self.populate_threads(1, 2)
+        with app.app_context():
+            with current_app.test_request_context():
+                with self.assertRaises(NotFound):
+                    Retriever().retrieve_thread('thread-0', 'respondent.99999')
+
+    def test_thread_list_returns_latest_message_per_thread(self):
+        """the thread list holds only the newest message of each thread"""
+        self.populate_threads(3, 3)
+        with app.app_context():
+            with current_app.test_request_context():
+                page = Retriever().retrieve_thread_list(1, MESSAGE_QUERY_LIMIT, 'internal.21345')[1]
+                self.assertEqual(sorted(message.id for message in page.items), [2, 5, 8])
+                self.assertFalse(page.has_next)
+
+    def test_thread_list_query_count_is_constant(self):
+        """listing threads issues the same queries however many threads there are"""
+        def serialize_threads():
+            page = Retriever().retrieve_thread_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+            for message in page.items:
+                message.serialize('respondent.21345')
+
+        self.populate_threads(MESSAGE_QUERY_LIMIT, 2)
+        with app.app_context():
+            with current_app.test_request_context():
+                query_count = self.count_queries(serialize_threads)
+        self.assertEqual(query_count, 2)
+
+    def index_messages(self, subjects):
+        """sets each message's subject in id order and builds the search index from them"""
+        with self.engine.connect() as con:
+            for row_id, subject in enumerate(subjects):
+                con.execute("UPDATE secure_message SET subject = '{0}' WHERE id = {1}".format(subject, row_id))
+        with app.app_context():
+            SearchIndex.rebuild_if_missing(self.db.session)
+
+    def test_search_returns_matching_visible_messages(self):
+        """search returns only messages holding every word that the user can see"""
+        self.populate_database(4)
+        self.index_messages(['annual return due', 'return received', 'query about return', 'other'])
+        with app.app_context():
+            with current_app.test_request_context():
+                found = Retriever().search_messages(['return'], 1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+                both = Retriever().search_messages(['return', 'due'], 1, MESSAGE_QUERY_LIMIT,
+                                                   'respondent.21345')[1]
+                hidden = Retriever().search_messages(['return'], 1, MESSAGE_QUERY_LIMIT, 'respondent.99999')[1]
+        self.assertEqual(sorted(message.id for message in found.items), [0, 1, 2])
+        self.assertEqual([message.id for message in both.items], [0])
+        self.assertEqual(hidden.items, [])
+
+    def test_search_ranks_better_matches_first(self):
+        """a message using the word more often ranks ahead of one using it once"""
+        self.populate_database(2)
+        self.index_messages(['survey', 'survey survey survey'])
+        with app.app_context():
+            with current_app.test_request_context():
+                found = Retriever().search_messages(['survey'], 1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
+        self.assertEqual([message.id for message in found.items], [1, 0])
+
+    def test_search_results_are_paged(self):
+        """search pages fetch one row more than the limit to find the next page"""
+        self.populate_database(3)
+        self.index_messages(['return', 'return', 'return'])
+        with app.app_context():
+            with current_app.test_request_context():
+                first = Retriever().search_messages(['return'], 1, 2, 'respondent.21345')[1]
+                second = Retriever().search_messages(['return'], 2, 2, 'respondent.21345')[1]
+        self.assertEqual((len(first.items), first.has_next, first.has_prev), (2, True, False))
+        self.assertEqual((len(second.items), second.has_next, second.has_prev), (1, False, True))
+
+    def test_message_stream_returns_every_message_with_labels(self):
+        """streams a mailbox larger than one batch returning each message once with its labels"""
+        self.populate_database(7)
+        with app.app_context():
+            with current_app.test_request_context():
+                messages = [message.serialize('internal.21345') for message in
+                            Retriever().retrieve_message_stream('internal.21345', batch_size=3)]
+                self.assertEqual(len(messages), 7)
+                self.assertEqual(len(set(message['msg_id'] for message in messages)), 7)
+                for message in messages:
+                    self.assertEqual(sorted(message['labels']), ['INBOX', 'UNREAD'])
+                    self.assertEqual(message['urn_from'], 'respondent.21345')
+
+    def test_message_stream_query_count_grows_per_batch_not_per_message(self):
+        """streaming loads statuses once per batch rather than once per message"""
+        def stream():
+            for message in Retriever().retrieve_message_stream('respondent.21345', batch_size=10):
+                message.serialize('respondent.21345')
+
+        self.populate_database(10)
+        with app.app_context():
+            with current_app.test_request_context():
+                query_count = self.count_queries(stream)
+        self.assertEqual(query_count, 2)
+
+    def test_decode_invalid_cursor_raises_bad_request(self):
+        """decoding a cursor that was not issued by the service raises BadRequest"""
+        with self.assertRaises(BadRequest):
+            MessageList._decode_cursor('not-a-cursor')
+
     def test_msg_returned_with_msg_id_true(self):
         """retrieves message using id"""
         # message_id = ""
@@ -184,7 +560,7 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT-1)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
@@ -195,19 +571,63 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT-1)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
                 self.assertEqual(data['messages']['4']['_links']['self']['href'],
                                  "{0}{1}".format(self.MESSAGE_BY_ID_ENDPOINT, data["messages"]['4']['msg_id']))
 
+    def test_paginated_to_json_with_total_returns_last_page(self):
+        """turns a counted page to json checking the total and a last link are given"""
+        self.populate_database(MESSAGE_QUERY_LIMIT + 1)
+        with app.app_context():
+            with current_app.test_request_context():
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'exact')[1]
+                json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
+                                                                  "http://localhost:5050/", 'respondent.21345')
+                data = json.loads(json_data.get_data())
+                self.assertEqual(data['total'], MESSAGE_QUERY_LIMIT + 1)
+                self.assertEqual(data['_links']['last']['href'],
+                                 "{0}?page=2&limit={1}".format(self.MESSAGE_LIST_ENDPOINT, MESSAGE_QUERY_LIMIT))
+
+    def test_paginated_to_json_without_total_has_no_last_page(self):
+        """turns an uncounted page to json checking neither total nor last link are given"""
+        self.populate_database(MESSAGE_QUERY_LIMIT + 1)
+        with app.app_context():
+            with current_app.test_request_context():
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345', 'none')[1]
+                json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
+                                                                  "http://localhost:5050/", 'respondent.21345')
+                data = json.loads(json_data.get_data())
+                self.assertFalse('total' in data)
+                self.assertFalse('last' in data['_links'])
+                self.assertTrue('next' in data['_links'])
+
+    def test_paginated_to_json_links_keep_filters(self):
+        """turns a filtered page to json checking the page links carry the filters"""
+        self.populate_database(MESSAGE_QUERY_LIMIT * 2)
+        with app.app_context():
+            with current_app.test_request_context():
+                filters = {'label': 'SENT', 'survey': 'SurveyType'}
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345',
+                                                         filters=filters)[1]
+                json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
+                                                                  "http://localhost:5050/", 'respondent.21345',
+                                                                  filters=filters)
+                data = json.loads(json_data.get_data())
+                self.assertEqual(data['_links']['next']['href'],
+                                 "{0}?page=2&limit={1}&label=SENT&survey=SurveyType"
+                                 .format(self.MESSAGE_LIST_ENDPOINT, MESSAGE_QUERY_LIMIT))
+                self.assertEqual(data['_links']['first']['href'],
+                                 "{0}?label=SENT&survey=SurveyType".format(self.MESSAGE_LIST_ENDPOINT))
+
     def test_paginated_to_json_returns_prev_page(self):
         """turns paginated result list to json checking prev page is returned if needed"""
         self.populate_database(MESSAGE_QUERY_LIMIT*2)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(2, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(2, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 2, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
@@ -218,7 +638,7 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT-1)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
@@ -229,7 +649,7 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT*2)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
@@ -240,7 +660,7 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT-1)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
@@ -251,7 +671,7 @@ class RetrieverTestCase(unittest.TestCase):
         self.populate_database(MESSAGE_QUERY_LIMIT - 1)
         with app.app_context():
             with current_app.test_request_context():
-                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT)[1]
+                resp = Retriever().retrieve_message_list(1, MESSAGE_QUERY_LIMIT, 'respondent.21345')[1]
                 json_data = MessageList()._paginated_list_to_json(resp, 1, MESSAGE_QUERY_LIMIT,
                                                                   "http://localhost:5050/", 'respondent.21345')
                 data = json.loads(json_data.get_data())
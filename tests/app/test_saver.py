@@ -108,3 +108,103 @@ class SaverTestCase(unittest.TestCase):
             with current_app.test_request_context():
                 with self.assertRaises(MessageSaveException):
                     Saver().save_msg_audit(message_audit['msg_id'], message_audit['msg_urn'], mock_session)
+
+    def test_staged_rows_are_not_written_until_commit(self):
+        """Tests message, status and audit staged without commit are written together by commit"""
+        message = Message(**{'msg_id': 'Amsgid', 'urn_to': 'tej', 'urn_from': 'gemma', 'subject': 'MyMessage',
+                             'body': 'hello', 'thread_id': ""})
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_message(message, datetime.now(timezone.utc), commit=False)
+                Saver().save_msg_status('gemma', 'Amsgid', 'SENT', commit=False)
+                Saver().save_msg_audit('Amsgid', 'gemma', commit=False)
+
+                with self.engine.connect() as con:
+                    self.assertEqual(con.execute('SELECT COUNT(*) FROM secure_message').scalar(), 0)
+
+                Saver().commit()
+
+        with self.engine.connect() as con:
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM secure_message').scalar(), 1)
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM status').scalar(), 1)
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM internal_sent_audit').scalar(), 1)
+
+    def label_count(self, actor, label):
+        """returns the stored count for an actor and label, None when there is no count row"""
+        with self.engine.connect() as con:
+            return con.execute("SELECT count FROM label_count WHERE actor='{0}' AND label='{1}'"
+                               .format(actor, label)).scalar()
+
+    def test_saved_msg_status_increments_label_count(self):
+        """Tests each saved status adds one to the count for its actor and label"""
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_msg_status('respondent.21345', 'AMsgId', 'INBOX')
+                Saver().save_msg_status('respondent.21345', 'AnotherMsgId', 'INBOX', commit=False)
+                Saver().save_msg_status('respondent.21345', 'AnotherMsgId', 'UNREAD', commit=False)
+                Saver().commit()
+
+        self.assertEqual(self.label_count('respondent.21345', 'INBOX'), 2)
+        self.assertEqual(self.label_count('respondent.21345', 'UNREAD'), 1)
+
+    def test_staged_statuses_bump_each_mailbox_once(self):
+        """Tests the statuses of a message staged together bump each mailbox passed to commit once"""
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_msg_status('ASurvey', 'AMsgId', 'INBOX', commit=False)
+                Saver().save_msg_status('ASurvey', 'AMsgId', 'UNREAD', commit=False)
+                Saver().save_msg_status('respondent.21345', 'AMsgId', 'SENT', commit=False)
+                Saver().commit(mailboxes=['ASurvey', 'ASurvey', 'respondent.21345'])
+
+        with self.engine.connect() as con:
+            versions = dict(con.execute('SELECT actor, version FROM mailbox_version').fetchall())
+        self.assertEqual(versions, {'ASurvey': 1, 'respondent.21345': 1})
+
+    def test_label_count_is_not_kept_when_status_is_rolled_back(self):
+        """Tests a count staged with its status is discarded when the status is rolled back"""
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_msg_status('respondent.21345', 'AMsgId', 'INBOX', commit=False)
+                db.session.rollback()
+
+        self.assertIsNone(self.label_count('respondent.21345', 'INBOX'))
+
+    def test_bulk_save_counts_statuses_per_actor(self):
+        """Tests bulk saved statuses are counted for each recipient"""
+        messages = [Message(**{'msg_id': msg_id, 'urn_to': 'respondent.1', 'urn_from': 'internal.1',
+                               'subject': 'MyMessage', 'body': 'hello', 'survey': 'ASurvey'})
+                    for msg_id in ['AMsgId', 'AnotherMsgId']]
+        statuses = [('ASurvey', 'AMsgId', 'SENT'), ('respondent.1', 'AMsgId', 'INBOX'),
+                    ('ASurvey', 'AnotherMsgId', 'SENT'), ('respondent.2', 'AnotherMsgId', 'INBOX')]
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_messages_bulk(messages, datetime.now(timezone.utc), statuses, [])
+
+        self.assertEqual(self.label_count('ASurvey', 'SENT'), 2)
+        self.assertEqual(self.label_count('respondent.1', 'INBOX'), 1)
+        self.assertEqual(self.label_count('respondent.2', 'INBOX'), 1)
+
+    def test_saved_message_is_added_to_search_index(self):
+        """Tests a saved message's subject and body are searchable once committed, and not before"""
+        message = Message(**{'msg_id': 'Amsgid', 'urn_to': 'tej', 'urn_from': 'gemma', 'subject': 'Annual return',
+                             'body': 'hello', 'thread_id': ""})
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_message(message, datetime.now(timezone.utc), commit=False)
+                db.session.rollback()
+                Saver().save_message(message, datetime.now(timezone.utc))
+
+        with self.engine.connect() as con:
+            rows = con.execute("SELECT msg_id FROM message_search WHERE message_search MATCH 'annual'").fetchall()
+        self.assertEqual([row[0] for row in rows], ['Amsgid'])
+
+    def test_commit_raises_message_save_exception_and_rolls_back_on_db_error(self):
+        """Tests MessageSaveException generated and staged rows discarded if the single commit fails"""
+        mock_session = mock.Mock(db.session)
+        mock_session.commit.side_effect = Exception("Not Saved")
+        with app.app_context():
+            with current_app.test_request_context():
+                Saver().save_msg_status('gemma', 'Amsgid', 'SENT', mock_session, commit=False)
+                with self.assertRaises(MessageSaveException):
+                    Saver().commit(mock_session)
+        mock_session.rollback.assert_called_once_with()
@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.repository.database import db, message_search
+from app.repository.search import PostgresSearch, SearchIndex, SqliteSearch
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    """Test case for the dialect specific parts of the search index"""
+
+    @staticmethod
+    def create_all(url, fts5=True, **kwargs):
+        """the DDL statements creating every table on a database at url, without connecting to one.
+        fts5 is whether an SQLite database is taken to support FTS5"""
+        statements = []
+        engine = create_engine(url, strategy='mock', executor=lambda sql, *multiparams, **params:
+                               statements.append(str(sql.compile(dialect=engine.dialect)).strip()), **kwargs)
+        with mock.patch('app.repository.database.sqlite_has_fts5', return_value=fts5):
+            db.metadata.create_all(engine, checkfirst=False)
+        return statements
+
+    def test_for_dialect_picks_postgres_only_for_postgresql(self):
+        """postgresql uses the tsvector backend, every other dialect the FTS5 one"""
+        self.assertIs(SearchIndex.for_dialect('postgresql'), PostgresSearch)
+        self.assertIs(SearchIndex.for_dialect('sqlite'), SqliteSearch)
+
+    def test_postgres_matches_use_tsquery_and_plain_terms(self):
+        """Postgres search ranks with ts_rank over the indexed document and passes words unquoted"""
+        matches = str(SearchIndex.matches('postgresql', ['annual', 'return']).compile(dialect=postgresql.dialect()))
+        self.assertIn("@@ plainto_tsquery('english', %(terms)s)", matches)
+        self.assertIn('ts_rank(' + PostgresSearch.DOCUMENT, matches)
+        self.assertEqual(PostgresSearch.terms(['annual', 'return']), 'annual return')
+
+    def test_sqlite_matches_quote_terms(self):
+        """SQLite search quotes each word so it is never read as FTS5 syntax"""
+        matches = str(SearchIndex.matches('sqlite', ['annual', 'OR']).compile(dialect=sqlite.dialect()))
+        self.assertIn('message_search MATCH ?', matches)
+        self.assertEqual(SqliteSearch.terms(['annual', 'OR']), '"annual" "OR"')
+
+    def test_postgres_creates_plain_table_with_document_index(self):
+        """on Postgres message_search is an ordinary table with a GIN index over its tsvector"""
+        statements = self.create_all('postgresql://', module=mock.Mock())
+        self.assertTrue(any(statement.startswith('CREATE TABLE message_search (') for statement in statements))
+        self.assertIn("CREATE INDEX ix_message_search_document ON message_search USING gin ({0})"
+                      .format(PostgresSearch.DOCUMENT), statements)
+        self.assertFalse(any('VIRTUAL' in statement for statement in statements))
+
+    def test_sqlite_creates_only_message_search_as_fts5(self):
+        """on SQLite message_search is an FTS5 table and every other table is created as usual"""
+        statements = self.create_all('sqlite://')
+        self.assertIn('CREATE VIRTUAL TABLE message_search USING fts5(msg_id UNINDEXED, subject, body)',
+                      statements)
+        self.assertEqual([statement for statement in statements if 'VIRTUAL' in statement or 'gin' in statement],
+                         ['CREATE VIRTUAL TABLE message_search USING fts5(msg_id UNINDEXED, subject, body)'])
+        created = [statement.split('(')[0].split()[-1] for statement in statements
+                   if statement.startswith('CREATE TABLE')]
+        self.assertEqual(sorted(created), sorted(table.name for table in db.metadata.sorted_tables
+                                                 if table is not message_search))
+
+    def test_sqlite_without_fts5_creates_plain_message_search(self):
+        """an SQLite library built without FTS5 gets an ordinary message_search table instead of failing"""
+        statements = self.create_all('sqlite://', fts5=False)
+        self.assertTrue(any(statement.startswith('CREATE TABLE message_search (') for statement in statements))
+        self.assertFalse(any('VIRTUAL' in statement for statement in statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
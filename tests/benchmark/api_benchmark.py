@@ -0,0 +1,165 @@
+"""
+Load benchmark of the REST API. Seeds a database with generated messages and statuses, then drives the
+main endpoints through the Flask test client and reports throughput and p50/p95/p99 per endpoint.
+Run from the project root with RAS_SM_PATH set: python run_benchmarks.py api
+
+BENCHMARK_DATABASE_URL    database to seed and serve from, defaults to a separate SQLite file
+BENCHMARK_MESSAGES        messages to seed, each has three statuses
+BENCHMARK_SURVEYS         surveys the messages are spread over
+BENCHMARK_RESPONDENTS     respondents the messages are spread over
+BENCHMARK_ITERATIONS      requests made to each endpoint
+BENCHMARK_MAX_P95_MS      fail, exiting non zero, when any endpoint's p95 is above this
+"""
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from app.application import app
+from app.common.alerts import AlertUser, AlertViaLogging
+from app.repository import database
+from app.repository.counters import LabelCounter
+from app.repository.search import SearchIndex
+
+from timing import measure, print_report
+
+DATABASE_URL = os.getenv('BENCHMARK_DATABASE_URL', 'sqlite:////tmp/messages-benchmark.db')
+MESSAGES = int(os.getenv('BENCHMARK_MESSAGES', '20000'))
+SURVEYS = int(os.getenv('BENCHMARK_SURVEYS', '1000'))
+RESPONDENTS = int(os.getenv('BENCHMARK_RESPONDENTS', '2000'))
+ITERATIONS = int(os.getenv('BENCHMARK_ITERATIONS', '200'))
+MAX_P95_MS = float(os.getenv('BENCHMARK_MAX_P95_MS', '0'))
+
+SEED_BATCH_SIZE = 5000
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def _respondent(number):
+    return 'respondent.{0}'.format(number)
+
+
+def _survey(number):
+    return 'survey-{0}'.format(number)
+
+
+def seed(messages, surveys, respondents, rng):
+    """recreate the schema and fill it with messages sent by respondents to surveys, returning
+    (msg_id, respondent, survey) for each message"""
+    database.db.drop_all()
+    database.db.create_all()
+    engine = database.db.engine
+    secure_message = database.SecureMessage.__table__
+    status = database.Status.__table__
+    start = datetime(2017, 1, 1)
+
+    seeded = []
+    for batch_start in range(0, messages, SEED_BATCH_SIZE):
+        message_rows = []
+        status_rows = []
+        for number in range(batch_start, min(messages, batch_start + SEED_BATCH_SIZE)):
+            msg_id = str(uuid.uuid4())
+            respondent = _respondent(rng.randrange(respondents))
+            survey = _survey(rng.randrange(surveys))
+            message_rows.append({'msg_id': msg_id, 'subject': 'Enquiry {0}'.format(number),
+                                 'body': 'Question about return {0} for {1}'.format(number, survey),
+                                 'thread_id': msg_id, 'sent_date': start + timedelta(minutes=number),
+                                 'collection_case': 'ACollectionCase', 'reporting_unit': 'AReportingUnit',
+                                 'survey': survey})
+            status_rows.extend([{'label': 'SENT', 'msg_id': msg_id, 'actor': respondent},
+                                {'label': 'INBOX', 'msg_id': msg_id, 'actor': survey},
+                                {'label': 'UNREAD', 'msg_id': msg_id, 'actor': survey}])
+            seeded.append((msg_id, respondent, survey))
+        with engine.begin() as connection:
+            connection.execute(secure_message.insert(), message_rows)
+            connection.execute(status.insert(), status_rows)
+
+    LabelCounter.rebuild_if_missing(database.db.session)
+    SearchIndex.rebuild_if_missing(database.db.session)
+    return seeded
+
+
+def _check(response, expected):
+    if response.status_code != expected:
+        raise AssertionError("Expected {0} but got {1}: {2}".format(expected, response.status_code, response.data))
+
+
+def endpoint_results(client, seeded, iterations, rng):
+    """time each endpoint against randomly chosen seeded messages and users"""
+
+    def pick():
+        return seeded[rng.randrange(len(seeded))]
+
+    def list_as_respondent():
+        _, respondent, _ = pick()
+        _check(client.get('/messages', headers={'user_urn': respondent}), 200)
+
+    def list_as_internal():
+        _, _, survey = pick()
+        _check(client.get('/messages?label=INBOX&survey={0}'.format(survey),
+                          headers={'user_urn': 'internal.benchmark'}), 200)
+
+    def get_message():
+        msg_id, respondent, _ = pick()
+        _check(client.get('/message/{0}'.format(msg_id), headers={'user_urn': respondent}), 200)
+
+    actions = {}
+
+    def modify_message():
+        msg_id, respondent, _ = pick()
+        action = 'remove' if actions.get(msg_id) == 'add' else 'add'
+        actions[msg_id] = action
+        _check(client.put('/message/{0}/modify'.format(msg_id), headers=dict(JSON_HEADERS, user_urn=respondent),
+                          data=json.dumps({'action': action, 'label': 'ARCHIVE'})), 200)
+
+    def _message():
+        _, respondent, survey = pick()
+        return {'urn_to': survey, 'urn_from': respondent, 'subject': 'Benchmark', 'body': 'Benchmark message',
+                'thread_id': '', 'collection_case': 'ACollectionCase', 'reporting_unit': 'AReportingUnit',
+                'survey': survey}
+
+    def send_message():
+        message = _message()
+        _check(client.post('/message/send', headers=dict(JSON_HEADERS, user_urn=message['urn_from']),
+                           data=json.dumps(message)), 201)
+
+    def save_draft():
+        message = _message()
+        _check(client.post('/draft/save', headers=dict(JSON_HEADERS, user_urn=message['urn_from']),
+                           data=json.dumps(message)), 201)
+
+    return [('GET /messages (respondent)', measure(list_as_respondent, iterations)),
+            ('GET /messages (internal, filtered)', measure(list_as_internal, iterations)),
+            ('GET /message/<id>', measure(get_message, iterations)),
+            ('PUT /message/<id>/modify', measure(modify_message, iterations)),
+            ('POST /message/send', measure(send_message, iterations)),
+            ('POST /draft/save', measure(save_draft, iterations))]
+
+
+def slow_endpoints(results, max_p95_ms):
+    """names of the endpoints whose p95 is above max_p95_ms, none when max_p95_ms is 0"""
+    if not max_p95_ms:
+        return []
+    return [name for name, summary in results if summary['p95_ms'] > max_p95_ms]
+
+
+def run(messages=MESSAGES, surveys=SURVEYS, respondents=RESPONDENTS, iterations=ITERATIONS, max_p95_ms=MAX_P95_MS):
+    """seed, drive and report, returning False when an endpoint is slower than max_p95_ms"""
+    rng = random.Random(0)
+    AlertUser.alert_method = AlertViaLogging()
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    with app.app_context():
+        seeded = seed(messages, surveys, respondents, rng)
+        database.db.session.remove()
+    results = endpoint_results(app.test_client(), seeded, iterations, rng)
+    print_report("API with {0} messages, {1} surveys, {2} respondents".format(messages, surveys, respondents),
+                 results)
+
+    slow = slow_endpoints(results, max_p95_ms)
+    for name in slow:
+        print("{0} p95 is above {1} ms".format(name, max_p95_ms))
+    return not slow
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,82 @@
+"""
+Benchmarks of token encryption, decryption and validation using the keys in jwt-test-keys.
+Run from the project root with RAS_SM_PATH set: python run_benchmarks.py
+"""
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from app import settings
+from app.authentication import jwe, jwt
+from app.authentication.authenticator import check_jwt, token_cache
+from app.authentication.jwe import Decrypter, Encrypter
+
+from timing import measure, print_report
+
+TOKEN_SIZES = [0, 1024, 8192]  # bytes of padding claim added to the minimum valid claims
+OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA1()), algorithm=hashes.SHA1(), label=None)
+
+
+def _encrypter():
+    return Encrypter(_private_key=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY,
+                     _private_key_password=settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                     _public_key=settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+
+
+def _claims(padding_size):
+    claims = {"RU": "12345678910", "survey": "BRS", "CC": "URN"}
+    if padding_size:
+        claims['padding'] = 'x' * padding_size
+    return claims
+
+
+def _load_keys():
+    jwe.load_keys(settings.SM_USER_AUTHENTICATION_PRIVATE_KEY, settings.SM_USER_AUTHENTICATION_PRIVATE_KEY_PASSWORD,
+                  settings.SM_USER_AUTHENTICATION_PUBLIC_KEY)
+
+
+def key_loading_results(iterations):
+    """cost of parsing the PEMs, with and without the process level key cache"""
+    return [('key load, uncached', measure(_load_keys, iterations, setup=jwe.reload_keys)),
+            ('key load, cached', measure(_load_keys, iterations * 10)),
+            ('Decrypter(), keys reparsed', measure(lambda: Decrypter(), iterations, setup=jwe.reload_keys))]
+
+
+def token_results(padding_size, iterations):
+    """cost of each stage of handling a token with padding_size bytes of extra claims"""
+    signed = jwt.encode(_claims(padding_size))
+    token = _encrypter().encrypt_token(signed).decode()
+    header, encrypted_key, encoded_iv, encoded_cipher_text, encoded_tag = token.split('.')
+
+    decrypter = Decrypter()
+    key = decrypter.private_key.decrypt(Decrypter._base64_decode(encrypted_key), OAEP)
+    iv = Decrypter._base64_decode(encoded_iv)
+    tag = Decrypter._base64_decode(encoded_tag)
+    cipher_text = Decrypter._base64_decode(encoded_cipher_text)
+
+    def base64_decode():
+        for segment in (encrypted_key, encoded_iv, encoded_cipher_text, encoded_tag):
+            Decrypter._base64_decode(segment)
+
+    size = len(token)
+    return [('jwt encode ({0} B token)'.format(size), measure(lambda: jwt.encode(_claims(padding_size)), iterations)),
+            ('jwt decode ({0} B token)'.format(size), measure(lambda: jwt.decode(signed), iterations)),
+            ('encrypt token ({0} B token)'.format(size), measure(lambda: _encrypter().encrypt_token(signed), iterations)),
+            ('base64 decode ({0} B token)'.format(size), measure(base64_decode, iterations)),
+            ('RSA unwrap ({0} B token)'.format(size),
+             measure(lambda: decrypter.private_key.decrypt(Decrypter._base64_decode(encrypted_key), OAEP), iterations)),
+            ('GCM decrypt ({0} B token)'.format(size),
+             measure(lambda: Decrypter._decrypt_cipher_text(cipher_text, iv, key, tag, header), iterations)),
+            ('decrypt token ({0} B token)'.format(size), measure(lambda: decrypter.decrypt_token(token), iterations)),
+            ('check_jwt, uncached ({0} B token)'.format(size),
+             measure(lambda: check_jwt(token), iterations, setup=token_cache.clear)),
+            ('check_jwt, cached ({0} B token)'.format(size), measure(lambda: check_jwt(token), iterations))]
+
+
+def run(iterations=200):
+    print_report("Key loading", key_loading_results(iterations))
+    for padding_size in TOKEN_SIZES:
+        print_report("Token with {0} B padding claim".format(padding_size), token_results(padding_size, iterations))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,43 @@
+"""
+Timing helpers shared by the benchmarks
+"""
+import time
+
+
+def percentile(samples, fraction):
+    """returns the sample at the given fraction of sorted samples, nearest rank"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarise(samples):
+    """returns ops/sec and p50/p95/p99 in milliseconds for a list of per-operation durations in seconds"""
+    total = sum(samples)
+    return {'count': len(samples),
+            'ops_per_sec': len(samples) / total if total > 0 else float('inf'),
+            'p50_ms': percentile(samples, 0.50) * 1000,
+            'p95_ms': percentile(samples, 0.95) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000}
+
+
+def measure(func, iterations, setup=None):
+    """times func over iterations, calling setup untimed before each call, and returns the summary"""
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarise(samples)
+
+
+def print_report(title, results):
+    """prints one row per (name, summary) pair"""
+    print(title)
+    print("{0:<40} {1:>12} {2:>10} {3:>10} {4:>10}".format('operation', 'ops/sec', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, summary in results:
+        print("{0:<40} {1:>12.1f} {2:>10.3f} {3:>10.3f} {4:>10.3f}".format(
+            name, summary['ops_per_sec'], summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+    print()